@@ -336,76 +336,14 @@ def show_standings_simple(standings_df, title, show_achievements=False, current_
     # Se disponibile, calcola la "Forma" (ultime 5) per ogni squadra
     if matches_df_for_form is not None and not standings_df.empty:
         try:
-            df_form = matches_df_for_form.copy()
-            # Parsing sicuro della data
-            df_form['date_parsed'] = pd.to_datetime(df_form['date'], errors='coerce')
-
-            def compute_last5(team_name: str):
-                # Filtra per venue richiesto
-                if venue_for_form == "CASA":
-                    team_matches = df_form[df_form['home_team'] == team_name]
-                elif venue_for_form == "FUORI":
-                    team_matches = df_form[df_form['away_team'] == team_name]
-                else:
-                    team_matches = df_form[(df_form['home_team'] == team_name) | (df_form['away_team'] == team_name)]
-
-                team_matches = team_matches.dropna(subset=['date_parsed'])
-                if team_matches.empty:
-                    return ''
-                team_matches = team_matches.sort_values('date_parsed', ascending=False).head(5)
-                symbols_data = []
-                for _, m in team_matches.iterrows():
-                    team_home = (m['home_team'] == team_name)
-                    # Determina l'esito V/N/P per la squadra in base al tipo classifica
-                    outcome = '?'
-                    if standings_type_for_form == "total":
-                        base_res = str(m.get('ft_result', '')).upper()
-                        if base_res == 'D':
-                            outcome = 'N'
-                        elif base_res == 'H':
-                            outcome = 'V' if team_home else 'P'
-                        elif base_res == 'A':
-                            outcome = 'V' if not team_home else 'P'
-                    elif standings_type_for_form == "first_half":
-                        base_res = str(m.get('ht_result', '')).upper()
-                        if base_res == 'D':
-                            outcome = 'N'
-                        elif base_res == 'H':
-                            outcome = 'V' if team_home else 'P'
-                        elif base_res == 'A':
-                            outcome = 'V' if not team_home else 'P'
-                    elif standings_type_for_form == "second_half":
-                        h2 = (m.get('ft_home_goals', 0) or 0) - (m.get('ht_home_goals', 0) or 0)
-                        a2 = (m.get('ft_away_goals', 0) or 0) - (m.get('ht_away_goals', 0) or 0)
-                        if h2 == a2:
-                            outcome = 'N'
-                        else:
-                            team_won = (h2 > a2 and team_home) or (a2 > h2 and not team_home)
-                            outcome = 'V' if team_won else 'P'
-                    
-                    # Prepara info partita
-                    home_team = str(m.get('home_team', ''))
-                    away_team = str(m.get('away_team', ''))
-                    home_goals = str(int(m.get('ft_home_goals', 0) or 0))
-                    away_goals = str(int(m.get('ft_away_goals', 0) or 0))
-                    match_date = str(m.get('date', ''))
-                    match_info = f"{home_team} {home_goals}-{away_goals} {away_team}\nData: {match_date}"
-                    symbols_data.append((outcome, match_info))
-
-                # Render come badge colorati (compatibili HTML su Streamlit/Render) - orizzontali come prima
-                def badge(s, info):
-                    color = '#28a745' if s == 'V' else ('#f0ad4e' if s == 'N' else ('#dc3545' if s == 'P' else '#6c757d'))
-                    # Escape quote per JavaScript
-                    info_escaped = info.replace("'", "\\'").replace('"', '\\"').replace('\n', '\\n')
-                    return f"<span onclick=\"alert('{info_escaped}')\" style='display:inline-block;background:{color};color:white;border-radius:0;width:24px;height:24px;line-height:24px;text-align:center;font-size:14px;font-weight:600;margin-right:4px;flex-shrink:0;cursor:pointer;' title='{info_escaped.replace('\\n', ' - ')}'>" + s + "</span>"
-
-                return ''.join([badge(s, info) for s, info in symbols_data])
+            form_df = calculator.calculate_team_form(matches_df_for_form, 5, standings_type_for_form, venue_for_form)
+            form_badges = form_badges_by_team(form_df)
 
             # Mappa squadra -> forma (supporta 'team' o 'Squadra')
             team_col = 'team' if 'team' in standings_df.columns else ('Squadra' if 'Squadra' in standings_df.columns else None)
             if team_col:
                 standings_df = standings_df.copy()
-                standings_df['Forma'] = standings_df[team_col].apply(compute_last5)
+                standings_df['Forma'] = standings_df[team_col].map(form_badges).fillna('')
         except Exception:
             # In caso di problemi, omette la colonna senza rompere la vista
             pass
@@ -499,6 +437,103 @@ def show_standings_simple(standings_df, title, show_achievements=False, current_
     
     st.markdown(css_style + html_table, unsafe_allow_html=True)
 
+# Filtri Under/Over (etichetta -> venue, tempo); importati qui, fuori dalla zona protetta
+from config import UNDER_OVER_FILTERS
+# Colonne delle partite lette dalle pagine (non tutta la riga di matches)
+from database import MATCH_RESULT_COLUMNS
+
+# Cubo Under/Over (tutte le soglie × venue × tempo) calcolato una sola volta per selezione:
+# cambiare soglia o filtro diventa una lettura, non un ricalcolo
+def get_under_over_cube(matches_df, selection_key):
+    cache = st.session_state.setdefault('under_over_cube_cache', {})
+    data_stamp = (len(matches_df), matches_df['id'].max() if 'id' in matches_df.columns else None)
+    key = (selection_key, data_stamp)
+    if key not in cache:
+        # Mantiene solo le selezioni più recenti
+        if len(cache) >= 4:
+            cache.pop(next(iter(cache)))
+        cache[key] = calculator.calculate_under_over_cube(matches_df)
+    return cache[key]
+
+# Classifica letta dalla tabella aggregata standings_agg quando la selezione copre
+# stagioni/campionati intere; altrimenti (fasi speciali) calcolata dalle partite
+STANDINGS_AGG_HALF = {"total": "TOTALE", "first_half": "I TEMPO", "second_half": "II TEMPO"}
+# Filtro tempo delle pagine Under/Over -> tempo di calculate_team_form
+UO_FORM_HALF = {tempo: tipo for tipo, tempo in STANDINGS_AGG_HALF.items()}
+
+def compute_standings(matches_df, standings_type="total", venue_filter="TOTALE", agg_filters=None, selection=None):
+    def compute():
+        if agg_filters is not None:
+            seasons, divisions = agg_filters
+            agg_df = db.get_standings_agg(seasons, divisions, venue=venue_filter, half=STANDINGS_AGG_HALF[standings_type])
+            return calculator.calculate_standings_from_agg(agg_df)
+        return calculator.calculate_standings(matches_df, standings_type, venue_filter=venue_filter)
+    
+    if selection is None:
+        return compute()
+    # selection = (stagioni, campionati, fase): identifica le partite usate, per la cache dei risultati
+    seasons, divisions, phase = selection
+    key = calculator.result_key("standings", seasons, divisions, standings_type=standings_type, venue=venue_filter, phase=phase)
+    return calculator.cached_result(key, compute)
+
+# Fasi dei campionati a due fasi (base / gironi / play-off Conference), calcolate una volta per selezione
+def get_competition_phases(matches_df, selection_key, base_matches=22):
+    cache = st.session_state.setdefault('competition_phases_cache', {})
+    data_stamp = (len(matches_df), matches_df['id'].max() if 'id' in matches_df.columns else None)
+    key = (selection_key, base_matches, data_stamp)
+    if key not in cache:
+        # Mantiene solo le selezioni più recenti
+        if len(cache) >= 4:
+            cache.pop(next(iter(cache)))
+        cache[key] = calculator.assign_competition_phases(matches_df, base_matches)
+    return cache[key]
+
+# Colonne "Forma" / "ULTIME 5": le ultime partite di tutte le squadre arrivano da
+# calculator.calculate_team_form (un solo ordinamento), qui si costruiscono solo i badge
+def form_badge(s, info):
+    color = '#28a745' if s == 'V' else ('#f0ad4e' if s == 'N' else ('#dc3545' if s == 'P' else '#6c757d'))
+    # Escape quote per JavaScript
+    info_escaped = info.replace("'", "\\'").replace('"', '\\"').replace('\n', '\\n')
+    return f"<span onclick=\"alert('{info_escaped}')\" style='display:inline-block;background:{color};color:white;border-radius:0;width:24px;height:24px;line-height:24px;text-align:center;font-size:14px;font-weight:600;margin-right:4px;flex-shrink:0;cursor:pointer;' title='{info_escaped.replace(chr(92)+'n', ' - ')}'>" + s + "</span>"
+
+def uo_badge(s):
+    # Verde + per Over, Rosso - per Under
+    if s == 'O':
+        return f"<span style='display:inline-block;background:#28a745;color:white;border-radius:6px;width:24px;height:24px;line-height:24px;text-align:center;font-size:14px;font-weight:600;margin-right:4px;flex-shrink:0;'>+</span>"
+    else:  # U
+        return f"<span style='display:inline-block;background:#dc3545;color:white;border-radius:6px;width:24px;height:24px;line-height:24px;text-align:center;font-size:14px;font-weight:600;margin-right:4px;flex-shrink:0;'>-</span>"
+
+def form_badges_by_team(form_df):
+    """Mappa squadra -> badge V/N/P delle ultime partite"""
+    if form_df.empty:
+        return {}
+    match_info = (
+        form_df['home_team'].astype(str) + ' '
+        + form_df['ft_home_goals'].fillna(0).astype(int).astype(str) + '-'
+        + form_df['ft_away_goals'].fillna(0).astype(int).astype(str) + ' '
+        + form_df['away_team'].astype(str) + '\nData: ' + form_df['date'].astype(str)
+    )
+    badges = pd.Series(
+        [form_badge(s, info) for s, info in zip(form_df['outcome'], match_info)],
+        index=form_df.index
+    )
+    return badges.groupby(form_df['team'], sort=False).agg(''.join).to_dict()
+
+def uo_badges_by_team(form_df, threshold):
+    """Mappa squadra -> badge Under/Over delle ultime partite (threshold: soglia unica o dict squadra -> soglia)"""
+    if form_df.empty:
+        return {}
+    if isinstance(threshold, dict):
+        thresholds = form_df['team'].map(threshold).to_numpy(dtype=float)
+    else:
+        thresholds = threshold
+    symbols = np.where(form_df['goals'].to_numpy(dtype=float) < thresholds, 'U', 'O')
+    badges = pd.Series([uo_badge(s) for s in symbols], index=form_df.index)
+    # Avvolge i badge in un container flex per evitare il wrap verticale
+    return badges.groupby(form_df['team'], sort=False).agg(
+        lambda b: f"<div style='display:flex;flex-wrap:nowrap;white-space:nowrap;align-items:center;'>{''.join(b)}</div>"
+    ).to_dict()
+
 # Pulsante rimosso - la navigazione è già visibile nella sidebar
 
 # Pagina Dashboard
@@ -519,10 +554,9 @@ if page == "📊 Dashboard":
         st.metric("Campionati", len(divisions))
     
     with col3:
-        conn = db.get_connection()
-        total_matches = pd.read_sql_query("SELECT COUNT(*) as count FROM matches", conn)['count'][0]
-        conn.close()
-        st.metric("Partite Totali", total_matches)
+        # Conteggi dal riepilogo dataset_summary (poche righe, aggiornate da import ed eliminazioni)
+        season_stats = db.get_dataset_summary('season')
+        st.metric("Partite Totali", int(season_stats['matches'].sum()))
     
     with col4:
         imported_files = db.get_imported_files()
@@ -531,16 +565,7 @@ if page == "📊 Dashboard":
     # Grafico delle stagioni
     if seasons:
         st.subheader("Distribuzione Partite per Stagione")
-        conn = db.get_connection()
-        season_stats = pd.read_sql_query("""
-            SELECT season, COUNT(*) as matches_count 
-            FROM matches 
-            GROUP BY season 
-            ORDER BY season
-        """, conn)
-        conn.close()
-        
-        fig = px.bar(season_stats, x='season', y='matches_count', 
+        fig = px.bar(season_stats.rename(columns={'matches': 'matches_count'}), x='season', y='matches_count',
                     title="Partite per Stagione")
         st.plotly_chart(fig, use_container_width=True)
     
@@ -579,9 +604,17 @@ elif page == "📁 Gestione Dati":
             
             if st.button("Importa File", type="primary"):
                 with st.spinner("Importazione in corso..."):
+                    # Avanzamento aggiornato dopo ogni blocco importato
+                    import_progress = st.progress(0.0, text="Importazione in corso...")
+                    def show_import_progress(stats):
+                        import_progress.progress(
+                            stats['progress'],
+                            text=f"Blocco {stats['chunks']}: {stats['rows_read']} righe lette, "
+                                 f"{stats['inserted']} importate, {stats['duplicates']} duplicate"
+                        )
                     # Passa sempre None per stagione (rilevamento automatico)
                     # Il parametro file_type non viene utilizzato, viene passato "main" come default
-                    success = db.import_excel_file(temp_path, None, "main")
+                    success = db.import_excel_file(temp_path, None, "main", progress_callback=show_import_progress)
                     if success:
                         st.success("File importato con successo!")
                         st.rerun()
@@ -619,30 +652,20 @@ elif page == "📁 Gestione Dati":
         
         # Normalizzazione stagioni
         with st.expander("Strumenti di manutenzione"):
+            cache_stats = calculator.result_cache.stats()
+            st.caption(
+                f"Cache risultati: {cache_stats['hits']} hit, {cache_stats['misses']} miss, "
+                f"{cache_stats['size']}/{cache_stats['maxsize']} voci (versione dati {cache_stats['data_version']})"
+            )
             if st.button("Normalizza stagioni (punto -> trattino, anno singolo -> range)"):
                 try:
-                    if hasattr(db, 'normalize_season_values'):
-                        _ = db.normalize_season_values()
-                    else:
-                        # Fallback inline se il metodo non fosse disponibile
-                        import sqlite3
-                        conn = db.get_connection()
-                        cur = conn.cursor()
-                        cur.execute("UPDATE matches SET season = TRIM(season) WHERE season IS NOT NULL")
-                        cur.execute("UPDATE matches SET season = REPLACE(season, '.', '-') WHERE season LIKE '%.%'")
-                        # Converte anni singoli
-                        rows = cur.execute("SELECT id, season FROM matches WHERE season IS NOT NULL").fetchall()
-                        to_update = []
-                        for _id, s in rows:
-                            s = str(s)
-                            if s.isdigit() and len(s) == 4:
-                                anno = int(s)
-                                to_update.append((f"{anno}-{anno+1}", _id))
-                        if to_update:
-                            cur.executemany("UPDATE matches SET season = ? WHERE id = ?", to_update)
-                        conn.commit()
-                        conn.close()
-                    st.success("Stagioni normalizzate. Riapri i filtri per aggiornare la lista.")
+                    conteggi = db.normalize_season_values()
+                    st.success(
+                        f"Stagioni normalizzate: {conteggi['rows']} partite aggiornate "
+                        f"(spazi {conteggi['trimmed']}, punto {conteggi['dot_separator']}, "
+                        f"slash {conteggi['slash_separator']}, anno singolo {conteggi['single_year']}). "
+                        "Riapri i filtri per aggiornare la lista."
+                    )
                     st.rerun()
                 except Exception as e:
                     st.error(f"Errore nella normalizzazione: {e}")
@@ -771,7 +794,7 @@ elif page == "🏆 Classifiche":
     
     # Carica i dati
     if selected_seasons and selected_divisions:
-        matches_df = db.get_matches_data(selected_seasons, selected_divisions)
+        matches_df = db.get_matches_data(selected_seasons, selected_divisions, columns=MATCH_RESULT_COLUMNS)
         
         if not matches_df.empty:
             # Determina la stagione corrente per i traguardi
@@ -783,180 +806,74 @@ elif page == "🏆 Classifiche":
             # Se il campionato ha regole speciali, filtra le partite in base alla fase selezionata
             if is_special_league and league_config:
                 selected_phase = st.session_state.get('selected_competition_phase', None)
+                # Fasi calcolate una volta per selezione: cambiare fase è solo un filtro
+                phased_matches = get_competition_phases(
+                    matches_df, (selected_division, tuple(selected_seasons)), league_config['base_matches']
+                )
                 
-                if selected_phase:
-                    # Converti date per ordinare le partite
-                    matches_df['date_parsed'] = pd.to_datetime(matches_df['date'], errors='coerce')
-                    matches_df = matches_df.sort_values('date_parsed')
-                    
-                    # Per ogni squadra, identifica le prime 22 partite (campionato base)
-                    base_matches = 22
-                    teams_base_matches = {}
-                    all_teams = set(matches_df['home_team'].unique()) | set(matches_df['away_team'].unique())
-                    
-                    for team in all_teams:
-                        # Partite dove la squadra ha giocato (casa o trasferta)
-                        team_matches = matches_df[
-                            (matches_df['home_team'] == team) | (matches_df['away_team'] == team)
-                        ].copy()
-                        team_matches = team_matches.sort_values('date_parsed')
-                        
-                        # Prime 22 partite
-                        first_22 = team_matches.head(base_matches)
-                        teams_base_matches[team] = set(first_22.index)
-                    
-                    # Tutte le partite base (prime 22 per ogni squadra)
-                    base_match_indices = set()
-                    for indices in teams_base_matches.values():
-                        base_match_indices.update(indices)
-                    
-                    # Calcola classifica base per determinare prime 6 e ultime 6
-                    base_matches_df = matches_df[matches_df.index.isin(base_match_indices)].copy()
-                    base_standings = calculator.calculate_standings(base_matches_df, "total")
-                    
-                    if not base_standings.empty:
-                        base_standings = base_standings.sort_values(['PT', 'DF'], ascending=[False, False])
-                        top_6_teams = set(base_standings.head(6)['team'].values)
-                        bottom_6_teams = set(base_standings.tail(6)['team'].values)
-                        
-                        # Filtra le partite in base alla fase selezionata
-                        if selected_phase == "playoffs_championship":
-                            # Partite dopo le 22 base dove entrambe le squadre sono tra le prime 6
-                            filtered_matches = matches_df[
-                                (~matches_df.index.isin(base_match_indices)) &
-                                (matches_df['home_team'].isin(top_6_teams)) &
-                                (matches_df['away_team'].isin(top_6_teams))
-                            ].copy()
-                            phase_title = "Play-Offs Championship"
-                            
-                        elif selected_phase == "relegation_group":
-                            # Partite dopo le 22 base dove entrambe le squadre sono tra le ultime 6
-                            filtered_matches = matches_df[
-                                (~matches_df.index.isin(base_match_indices)) &
-                                (matches_df['home_team'].isin(bottom_6_teams)) &
-                                (matches_df['away_team'].isin(bottom_6_teams))
-                            ].copy()
-                            phase_title = "Gruppo Retrocessione"
-                            
-                        elif selected_phase == "conference_playoff":
-                            # Calcola classifiche dei mini-campionati per trovare le squadre qualificate
-                            playoffs_matches = matches_df[
-                                (~matches_df.index.isin(base_match_indices)) &
-                                (matches_df['home_team'].isin(top_6_teams)) &
-                                (matches_df['away_team'].isin(top_6_teams))
-                            ].copy()
-                            
-                            relegation_matches = matches_df[
-                                (~matches_df.index.isin(base_match_indices)) &
-                                (matches_df['home_team'].isin(bottom_6_teams)) &
-                                (matches_df['away_team'].isin(bottom_6_teams))
-                            ].copy()
-                            
-                            # Calcola classifiche dei mini-campionati (solo partite dei mini-campionati)
-                            if not playoffs_matches.empty:
-                                playoffs_standings = calculator.calculate_standings(playoffs_matches, "total")
-                                playoffs_standings = playoffs_standings.sort_values(['PT', 'DF'], ascending=[False, False])
-                                if len(playoffs_standings) >= 5:
-                                    qualified_5th_playoffs = playoffs_standings.iloc[4]['team']
-                                else:
-                                    qualified_5th_playoffs = None
-                            else:
-                                qualified_5th_playoffs = None
-                            
-                            if not relegation_matches.empty:
-                                relegation_standings = calculator.calculate_standings(relegation_matches, "total")
-                                relegation_standings = relegation_standings.sort_values(['PT', 'DF'], ascending=[False, False])
-                                if len(relegation_standings) >= 2:
-                                    qualified_1st_relegation = relegation_standings.iloc[0]['team']
-                                    qualified_2nd_relegation = relegation_standings.iloc[1]['team']
-                                else:
-                                    qualified_1st_relegation = None
-                                    qualified_2nd_relegation = None
-                            else:
-                                qualified_1st_relegation = None
-                                qualified_2nd_relegation = None
-                            
-                            # Partite Conference League Play Off: tra le squadre qualificate
-                            qualified_teams = set()
-                            if qualified_5th_playoffs:
-                                qualified_teams.add(qualified_5th_playoffs)
-                            if qualified_1st_relegation:
-                                qualified_teams.add(qualified_1st_relegation)
-                            if qualified_2nd_relegation:
-                                qualified_teams.add(qualified_2nd_relegation)
-                            
-                            filtered_matches = matches_df[
-                                (~matches_df.index.isin(base_match_indices)) &
-                                (
-                                    (matches_df['home_team'].isin(qualified_teams) & matches_df['away_team'].isin(qualified_teams))
-                                )
-                            ].copy()
-                            phase_title = "Conference League - Play Offs"
-                        else:
-                            filtered_matches = matches_df.copy()
-                            phase_title = "Classifica Totale"
-                    else:
-                        filtered_matches = matches_df.copy()
-                        phase_title = "Classifica Totale"
+                if selected_phase == "playoffs_championship":
+                    filtered_matches = phased_matches[phased_matches['phase'] == 'championship'].copy()
+                    phase_title = "Play-Offs Championship"
+                elif selected_phase == "relegation_group":
+                    filtered_matches = phased_matches[phased_matches['phase'] == 'relegation'].copy()
+                    phase_title = "Gruppo Retrocessione"
+                elif selected_phase == "conference_playoff":
+                    filtered_matches = phased_matches[phased_matches['conference_playoff']].copy()
+                    phase_title = "Conference League - Play Offs"
+                elif selected_phase:
+                    filtered_matches = matches_df.copy()
+                    phase_title = "Classifica Totale"
                 else:
                     # Campionato Base: solo prime 22 partite per squadra
-                    matches_df['date_parsed'] = pd.to_datetime(matches_df['date'], errors='coerce')
-                    matches_df = matches_df.sort_values('date_parsed')
-                    
-                    all_teams = set(matches_df['home_team'].unique()) | set(matches_df['away_team'].unique())
-                    base_match_indices = set()
-                    
-                    for team in all_teams:
-                        team_matches = matches_df[
-                            (matches_df['home_team'] == team) | (matches_df['away_team'] == team)
-                        ].copy()
-                        team_matches = team_matches.sort_values('date_parsed')
-                        first_22 = team_matches.head(22)
-                        base_match_indices.update(first_22.index)
-                    
-                    filtered_matches = matches_df[matches_df.index.isin(base_match_indices)].copy()
-                    phase_title = "Campionato Base (22 partite)"
+                    filtered_matches = phased_matches[phased_matches['phase'] == 'base'].copy()
+                    phase_title = f"Campionato Base ({league_config['base_matches']} partite)"
             else:
                 filtered_matches = matches_df.copy()
             
             # Usa filtered_matches invece di matches_df per i calcoli
             matches_df_to_use = filtered_matches
+            # Senza fasi speciali la classifica coincide con quella aggregata in standings_agg
+            agg_filters = None if (is_special_league and league_config) else (selected_seasons, selected_divisions)
+            standings_selection = (
+                selected_seasons, selected_divisions,
+                st.session_state.get('selected_competition_phase') if (is_special_league and league_config) else None
+            )
             
             # Gestisce i diversi tipi di classifiche
             if standings_type == "Totale":
-                standings_df = calculator.calculate_standings(matches_df_to_use, "total")
+                standings_df = compute_standings(matches_df_to_use, "total", agg_filters=agg_filters, selection=standings_selection)
                 show_standings_simple(standings_df, phase_title, show_achievements=True, current_season=current_season_for_achievements, matches_df_for_form=matches_df_to_use, standings_type_for_form="total", venue_for_form="TOTALE")
             
             elif standings_type == "I Tempo":
-                standings_df = calculator.calculate_standings(matches_df_to_use, "first_half")
+                standings_df = compute_standings(matches_df_to_use, "first_half", agg_filters=agg_filters, selection=standings_selection)
                 show_standings_simple(standings_df, "Classifica I Tempo", matches_df_for_form=matches_df_to_use, standings_type_for_form="first_half", venue_for_form="TOTALE")
             
             elif standings_type == "II Tempo":
-                standings_df = calculator.calculate_standings(matches_df_to_use, "second_half")
+                standings_df = compute_standings(matches_df_to_use, "second_half", agg_filters=agg_filters, selection=standings_selection)
                 show_standings_simple(standings_df, "Classifica II Tempo", matches_df_for_form=matches_df_to_use, standings_type_for_form="second_half", venue_for_form="TOTALE")
             
             elif standings_type == "Casa":
-                standings_df = calculator.calculate_standings(matches_df_to_use, "total", venue_filter="CASA")
+                standings_df = compute_standings(matches_df_to_use, "total", venue_filter="CASA", agg_filters=agg_filters, selection=standings_selection)
                 show_standings_simple(standings_df, "Classifica Casa", show_achievements=True, current_season=current_season_for_achievements, matches_df_for_form=matches_df_to_use, standings_type_for_form="total", venue_for_form="CASA")
             
             elif standings_type == "Fuori":
-                standings_df = calculator.calculate_standings(matches_df_to_use, "total", venue_filter="FUORI")
+                standings_df = compute_standings(matches_df_to_use, "total", venue_filter="FUORI", agg_filters=agg_filters, selection=standings_selection)
                 show_standings_simple(standings_df, "Classifica Fuori", show_achievements=True, current_season=current_season_for_achievements, matches_df_for_form=matches_df_to_use, standings_type_for_form="total", venue_for_form="FUORI")
             
             elif standings_type == "Casa I Tempo":
-                standings_df = calculator.calculate_standings(matches_df_to_use, "first_half", venue_filter="CASA")
+                standings_df = compute_standings(matches_df_to_use, "first_half", venue_filter="CASA", agg_filters=agg_filters, selection=standings_selection)
                 show_standings_simple(standings_df, "Classifica Casa I Tempo", matches_df_for_form=matches_df_to_use, standings_type_for_form="first_half", venue_for_form="CASA")
             
             elif standings_type == "Fuori I Tempo":
-                standings_df = calculator.calculate_standings(matches_df_to_use, "first_half", venue_filter="FUORI")
+                standings_df = compute_standings(matches_df_to_use, "first_half", venue_filter="FUORI", agg_filters=agg_filters, selection=standings_selection)
                 show_standings_simple(standings_df, "Classifica Fuori I Tempo", matches_df_for_form=matches_df_to_use, standings_type_for_form="first_half", venue_for_form="FUORI")
             
             elif standings_type == "Casa II Tempo":
-                standings_df = calculator.calculate_standings(matches_df_to_use, "second_half", venue_filter="CASA")
+                standings_df = compute_standings(matches_df_to_use, "second_half", venue_filter="CASA", agg_filters=agg_filters, selection=standings_selection)
                 show_standings_simple(standings_df, "Classifica Casa II Tempo", matches_df_for_form=matches_df_to_use, standings_type_for_form="second_half", venue_for_form="CASA")
             
             elif standings_type == "Fuori II Tempo":
-                standings_df = calculator.calculate_standings(matches_df_to_use, "second_half", venue_filter="FUORI")
+                standings_df = compute_standings(matches_df_to_use, "second_half", venue_filter="FUORI", agg_filters=agg_filters, selection=standings_selection)
                 show_standings_simple(standings_df, "Classifica Fuori II Tempo", matches_df_for_form=matches_df_to_use, standings_type_for_form="second_half", venue_for_form="FUORI")
             
             elif standings_type == "Con Parametri":
@@ -976,8 +893,12 @@ elif page == "🏆 Classifiche":
                         help="Numero di squadre dal fondo da escludere"
                     )
                 
-                standings_df = calculator.calculate_standings(
-                    matches_df_to_use, "total", exclude_top, exclude_bottom
+                standings_df = calculator.cached_result(
+                    calculator.result_key(
+                        "standings", selected_seasons, selected_divisions, standings_type="total",
+                        phase=standings_selection[2], exclude_top=exclude_top, exclude_bottom=exclude_bottom
+                    ),
+                    lambda: calculator.calculate_standings(matches_df_to_use, "total", exclude_top, exclude_bottom)
                 )
                 show_standings_simple(
                     standings_df,
@@ -1133,7 +1054,7 @@ elif page == "📊 Under/Over":
     with col3:
         venue_filter = st.selectbox(
             "Filtro",
-            ["Totale", "Casa", "Fuori", "I Tempo", "Casa I Tempo", "Fuori I Tempo", "II Tempo", "Casa II Tempo", "Fuori II Tempo"],
+            list(UNDER_OVER_FILTERS),
             key="uo_venue"
         )
     
@@ -1161,43 +1082,20 @@ elif page == "📊 Under/Over":
     
     # Mostra sempre una classifica Under/Over
     if selected_seasons_uo and selected_division_uo:
-        matches_df_uo = db.get_matches_data(selected_seasons_uo, [selected_division_uo])
+        matches_df_uo = db.get_matches_data(selected_seasons_uo, [selected_division_uo], columns=MATCH_RESULT_COLUMNS)
         
         if not matches_df_uo.empty:
-            # Estrai parametri dal filtro selezionato
-            if venue_filter == "Totale":
-                venue_param = "TOTALE"
-                time_param = "TOTALE"
-            elif venue_filter == "Casa":
-                venue_param = "CASA"
-                time_param = "TOTALE"
-            elif venue_filter == "Fuori":
-                venue_param = "FUORI"
-                time_param = "TOTALE"
-            elif venue_filter == "I Tempo":
-                venue_param = "TOTALE"
-                time_param = "I TEMPO"
-            elif venue_filter == "Casa I Tempo":
-                venue_param = "CASA"
-                time_param = "I TEMPO"
-            elif venue_filter == "Fuori I Tempo":
-                venue_param = "FUORI"
-                time_param = "I TEMPO"
-            elif venue_filter == "II Tempo":
-                venue_param = "TOTALE"
-                time_param = "II TEMPO"
-            elif venue_filter == "Casa II Tempo":
-                venue_param = "CASA"
-                time_param = "II TEMPO"
-            elif venue_filter == "Fuori II Tempo":
-                venue_param = "FUORI"
-                time_param = "II TEMPO"
-            else:
-                venue_param = "TOTALE"
-                time_param = "TOTALE"
-            
-            # Calcola classifica Under/Over
-            standings_df_uo = calculator.calculate_under_over_standings(matches_df_uo, threshold, venue_param, time_param)
+            # Tutte le nove classifiche (venue × tempo) della soglia calcolate insieme:
+            # cambiare filtro è una lettura dalla cache
+            uo_tables = calculator.cached_result(
+                calculator.result_key("under_over_tables", selected_seasons_uo, [selected_division_uo], threshold=threshold),
+                lambda: calculator.under_over_tables_from_cube(
+                    get_under_over_cube(matches_df_uo, ("underover", tuple(selected_seasons_uo), selected_division_uo)),
+                    threshold
+                )
+            )
+            time_param = UNDER_OVER_FILTERS.get(venue_filter, ("TOTALE", "TOTALE"))[1]
+            standings_df_uo = uo_tables.get(venue_filter, pd.DataFrame())
             
             # Ordina per la percentuale più alta (max tra U% e O%), dalla più alta alla più bassa
             if not standings_df_uo.empty and 'U%' in standings_df_uo.columns and 'O%' in standings_df_uo.columns:
@@ -1207,57 +1105,14 @@ elif page == "📊 Under/Over":
             
             # Aggiungi colonna "ULTIME 5" per Under/Over
             if not standings_df_uo.empty:
-                def compute_last5_uo(team_name: str):
-                    # Prendi tutte le partite della squadra
-                    team_matches = matches_df_uo[(matches_df_uo['home_team'] == team_name) | (matches_df_uo['away_team'] == team_name)].copy()
-                    
-                    # Parse date
-                    team_matches['date_parsed'] = pd.to_datetime(team_matches['date'], errors='coerce')
-                    team_matches = team_matches.dropna(subset=['date_parsed'])
-                    
-                    if team_matches.empty:
-                        return ''
-                    
-                    # Ordina per data (più recente prima)
-                    team_matches = team_matches.sort_values('date_parsed', ascending=False).head(5)
-                    
-                    symbols = []
-                    for _, m in team_matches.iterrows():
-                        # Calcola gol in base al filtro tempo
-                        if time_param == "I TEMPO":
-                            home_goals = pd.to_numeric(m.get('ht_home_goals', 0), errors='coerce') or 0
-                            away_goals = pd.to_numeric(m.get('ht_away_goals', 0), errors='coerce') or 0
-                        elif time_param == "II TEMPO":
-                            home_goals = (pd.to_numeric(m.get('ft_home_goals', 0), errors='coerce') or 0) - (pd.to_numeric(m.get('ht_home_goals', 0), errors='coerce') or 0)
-                            away_goals = (pd.to_numeric(m.get('ft_away_goals', 0), errors='coerce') or 0) - (pd.to_numeric(m.get('ht_away_goals', 0), errors='coerce') or 0)
-                        else:  # TOTALE
-                            home_goals = pd.to_numeric(m.get('ft_home_goals', 0), errors='coerce') or 0
-                            away_goals = pd.to_numeric(m.get('ft_away_goals', 0), errors='coerce') or 0
-                        
-                        total_goals = home_goals + away_goals
-                        
-                        # Determina Over o Under
-                        if total_goals < threshold:
-                            symbols.append('U')  # Under
-                        else:
-                            symbols.append('O')  # Over
-                    
-                    # Render come badge colorati: Verde + per Over, Rosso - per Under
-                    def badge_uo(s):
-                        if s == 'O':
-                            return f"<span style='display:inline-block;background:#28a745;color:white;border-radius:6px;width:24px;height:24px;line-height:24px;text-align:center;font-size:14px;font-weight:600;margin-right:4px;flex-shrink:0;'>+</span>"
-                        else:  # U
-                            return f"<span style='display:inline-block;background:#dc3545;color:white;border-radius:6px;width:24px;height:24px;line-height:24px;text-align:center;font-size:14px;font-weight:600;margin-right:4px;flex-shrink:0;'>-</span>"
-                    
-                    # Avvolgi i badge in un container flex per evitare il wrap verticale
-                    badges_html = ''.join([badge_uo(s) for s in symbols])
-                    return f"<div style='display:flex;flex-wrap:nowrap;white-space:nowrap;align-items:center;'>{badges_html}</div>"
+                form_df_uo = calculator.calculate_team_form(matches_df_uo, 5, UO_FORM_HALF[time_param])
+                uo_badges = uo_badges_by_team(form_df_uo, threshold)
                 
                 # Aggiungi colonna ULTIME 5
                 team_col = 'team' if 'team' in standings_df_uo.columns else ('Squadra' if 'Squadra' in standings_df_uo.columns else None)
                 if team_col:
                     standings_df_uo = standings_df_uo.copy()
-                    standings_df_uo['ULTIME 5'] = standings_df_uo[team_col].apply(compute_last5_uo)
+                    standings_df_uo['ULTIME 5'] = standings_df_uo[team_col].map(uo_badges).fillna('')
             
             # Usa show_standings_simple per visualizzare (come in Best Teams)
             show_standings_simple(standings_df_uo, f"Classifica Under/Over {threshold}")
@@ -1368,15 +1223,21 @@ elif page == "📊 Classifiche con Parametri":
             # exclude_top e exclude_bottom sono già definiti dai filtri sopra
             
             # Ottieni dati delle partite
-            matches_df = db.get_matches_data(selected_seasons, [selected_division])
+            matches_df = db.get_matches_data(selected_seasons, [selected_division], columns=MATCH_RESULT_COLUMNS)
             
             if not matches_df.empty:
                 # Calcola classifiche con esclusione scontri diretti
-                standings_df = calculator.calculate_standings(
-                    matches_df, 
-                    standings_type="TOTALE",
-                    exclude_top=exclude_top,
-                    exclude_bottom=exclude_bottom
+                standings_df = calculator.cached_result(
+                    calculator.result_key(
+                        "standings", selected_seasons, [selected_division], standings_type="total",
+                        phase=None, exclude_top=exclude_top, exclude_bottom=exclude_bottom
+                    ),
+                    lambda: calculator.calculate_standings(
+                        matches_df, 
+                        standings_type="TOTALE",
+                        exclude_top=exclude_top,
+                        exclude_bottom=exclude_bottom
+                    )
                 )
                 
                 if not standings_df.empty:
@@ -1405,48 +1266,13 @@ elif page == "📊 Classifiche con Parametri":
                     # Prepara tabella con colonna "Forma" come in Classifiche
                     if not standings_df.empty:
                         try:
-                            df_form_matches = matches_df.copy()
-                            df_form_matches['date_parsed'] = pd.to_datetime(df_form_matches['date'], errors='coerce')
-
-                            def compute_last5(team_name: str):
-                                tm = df_form_matches[(df_form_matches['home_team'] == team_name) | (df_form_matches['away_team'] == team_name)].dropna(subset=['date_parsed'])
-                                if tm.empty:
-                                    return ''
-                                tm = tm.sort_values('date_parsed', ascending=False).head(5)
-                                symbols_data = []
-                                for _, m in tm.iterrows():
-                                    team_home = (m['home_team'] == team_name)
-                                    base_res = str(m.get('ft_result', '')).upper()
-                                    if base_res == 'D':
-                                        outcome = 'N'
-                                    elif base_res == 'H':
-                                        outcome = 'V' if team_home else 'P'
-                                    elif base_res == 'A':
-                                        outcome = 'V' if not team_home else 'P'
-                                    else:
-                                        outcome = '?'
-                                    
-                                    # Prepara info partita
-                                    home_team = str(m.get('home_team', ''))
-                                    away_team = str(m.get('away_team', ''))
-                                    home_goals = str(int(m.get('ft_home_goals', 0) or 0))
-                                    away_goals = str(int(m.get('ft_away_goals', 0) or 0))
-                                    match_date = str(m.get('date', ''))
-                                    match_info = f"{home_team} {home_goals}-{away_goals} {away_team}\nData: {match_date}"
-                                    symbols_data.append((outcome, match_info))
-                                    
-                                def badge(s, info):
-                                    color = '#28a745' if s == 'V' else ('#f0ad4e' if s == 'N' else ('#dc3545' if s == 'P' else '#6c757d'))
-                                    # Escape quote per JavaScript
-                                    info_escaped = info.replace("'", "\\'").replace('"', '\\"').replace('\n', '\\n')
-                                    return f"<span onclick=\"alert('{info_escaped}')\" style='display:inline-block;background:{color};color:white;border-radius:0;width:24px;height:24px;line-height:24px;text-align:center;font-size:14px;font-weight:600;margin-right:4px;flex-shrink:0;cursor:pointer;' title='{info_escaped.replace(chr(92)+'n', ' - ')}'>" + s + "</span>"
-                                return ''.join(badge(s, info) for s, info in symbols_data)
+                            form_badges = form_badges_by_team(calculator.calculate_team_form(matches_df, 5))
 
                             display_df = standings_df.copy()
                             # Aggiungi Forma usando colonna team
                             team_col = 'team' if 'team' in display_df.columns else ('Squadra' if 'Squadra' in display_df.columns else None)
                             if team_col:
-                                display_df['Forma'] = display_df[team_col].apply(compute_last5)
+                                display_df['Forma'] = display_df[team_col].map(form_badges).fillna('')
                             # Rinomina team -> Squadra
                             if 'team' in display_df.columns:
                                 display_df = display_df.rename(columns={'team': 'Squadra'})
@@ -1612,86 +1438,35 @@ elif page == "🏆 Best Teams":
         st.write("")  # Spazio vuoto
     
     if selected_seasons:
-        # Ottieni dati da TUTTI i campionati (nessun filtro divisione)
-        matches_df = db.get_matches_data(selected_seasons, [])
+        # Contatori per squadra di TUTTI i campionati aggregati in SQLite (nessun filtro divisione):
+        # in Python arrivano solo le righe aggregate
+        best_agg = db.get_standings_agg(selected_seasons, None, half="TOTALE")
         
-        if not matches_df.empty:
+        # Partite (per la colonna Forma / ULTIME 5) caricate solo per le squadre mostrate
+        def best_form_matches(teams):
+            if len(teams) == 0:
+                return pd.DataFrame()
+            return db.get_matches_data(selected_seasons, [], teams=list(teams), columns=MATCH_RESULT_COLUMNS)
+        
+        if not best_agg.empty:
             tab1, tab2, tab3, tab4 = st.tabs(["Classifica BEST", "Classifica BEST con Parametri", "Classifica BEST Under/Over", "Classifica U/O Totale"])
             
+            # Squadre sopra soglia: stessa tabella per le prime due tab
+            best_teams_df = calculator.cached_result(
+                calculator.result_key("best_teams", selected_seasons, threshold=percentage_threshold),
+                lambda: calculator.calculate_best_teams(best_agg, percentage_threshold)
+            )
+            best_teams_form_df = best_form_matches(best_teams_df['Squadra'])
+            
             with tab1:
                 st.subheader("Classifica BEST")
                 
-                # Calcola statistiche per ogni squadra
-                teams_stats = []
-                
-                for team in matches_df['home_team'].unique():
-                    # Partite in casa
-                    home_matches = matches_df[matches_df['home_team'] == team]
-                    # Partite in trasferta
-                    away_matches = matches_df[matches_df['away_team'] == team]
-                    
-                    # Calcola statistiche
-                    total_matches = len(home_matches) + len(away_matches)
-                    if total_matches == 0:
-                        continue
-                    
-                    # Vittorie
-                    home_wins = len(home_matches[home_matches['ft_result'] == 'H'])
-                    away_wins = len(away_matches[away_matches['ft_result'] == 'A'])
-                    total_wins = home_wins + away_wins
-                    win_percentage = (total_wins / total_matches) * 100
-                    
-                    # Pareggi
-                    home_draws = len(home_matches[home_matches['ft_result'] == 'D'])
-                    away_draws = len(away_matches[away_matches['ft_result'] == 'D'])
-                    total_draws = home_draws + away_draws
-                    draw_percentage = (total_draws / total_matches) * 100
-                    
-                    # Sconfitte
-                    home_losses = len(home_matches[home_matches['ft_result'] == 'A'])
-                    away_losses = len(away_matches[away_matches['ft_result'] == 'H'])
-                    total_losses = home_losses + away_losses
-                    loss_percentage = (total_losses / total_matches) * 100
-                    
-                    # Determina cosa giocare
-                    play_what = ""
-                    if win_percentage >= percentage_threshold:
-                        play_what = "V"
-                    elif draw_percentage >= percentage_threshold:
-                        play_what = "N"
-                    elif loss_percentage >= percentage_threshold:
-                        play_what = "P"
-                    
-                    # Aggiungi solo se supera la soglia
-                    if win_percentage >= percentage_threshold or draw_percentage >= percentage_threshold or loss_percentage >= percentage_threshold:
-                        teams_stats.append({
-                            'Squadra': team,
-                            'PG': total_matches,
-                            'V': total_wins,
-                            'N': total_draws,
-                            'P': total_losses,
-                            'V%': round(win_percentage, 1),
-                            'N%': round(draw_percentage, 1),
-                            'P%': round(loss_percentage, 1),
-                            'Gioca': play_what
-                        })
-                
-                if teams_stats:
-                    # Converti in DataFrame
-                    best_teams_df = pd.DataFrame(teams_stats)
-                    
-                    # Ordina per la percentuale più alta tra V%, N%, P%
-                    best_teams_df['Max_Percentage'] = best_teams_df[['V%', 'N%', 'P%']].max(axis=1)
-                    best_teams_df = best_teams_df.sort_values('Max_Percentage', ascending=False)
-                    
-                    # Rimuovi la colonna temporanea
-                    best_teams_df = best_teams_df.drop('Max_Percentage', axis=1)
-                    
+                if not best_teams_df.empty:
                     # Mostra la classifica con colonna Forma tra P% e Gioca
                     show_standings_simple(
                         best_teams_df,
                         f"Best Teams (Soglia: {percentage_threshold}%)",
-                        matches_df_for_form=matches_df,
+                        matches_df_for_form=best_teams_form_df,
                         standings_type_for_form="total",
                         venue_for_form="TOTALE",
                         form_insert_after="P%",
@@ -1703,96 +1478,7 @@ elif page == "🏆 Best Teams":
             with tab2:
                 st.subheader("Classifica BEST con Parametri")
                 
-                # Calcola statistiche per ogni squadra considerando V%, N%, P%
-                all_teams_stats = []
-                
-                for team in matches_df['home_team'].unique():
-                    # Partite in casa
-                    home_matches = matches_df[matches_df['home_team'] == team]
-                    # Partite in trasferta
-                    away_matches = matches_df[matches_df['away_team'] == team]
-                    
-                    # Calcola statistiche
-                    total_matches = len(home_matches) + len(away_matches)
-                    if total_matches == 0:
-                        continue
-                    
-                    # Vittorie
-                    home_wins = len(home_matches[home_matches['ft_result'] == 'H'])
-                    away_wins = len(away_matches[away_matches['ft_result'] == 'A'])
-                    total_wins = home_wins + away_wins
-                    win_percentage = (total_wins / total_matches) * 100
-                    
-                    # Pareggi
-                    home_draws = len(home_matches[home_matches['ft_result'] == 'D'])
-                    away_draws = len(away_matches[away_matches['ft_result'] == 'D'])
-                    total_draws = home_draws + away_draws
-                    draw_percentage = (total_draws / total_matches) * 100
-                    
-                    # Sconfitte
-                    home_losses = len(home_matches[home_matches['ft_result'] == 'A'])
-                    away_losses = len(away_matches[away_matches['ft_result'] == 'H'])
-                    total_losses = home_losses + away_losses
-                    loss_percentage = (total_losses / total_matches) * 100
-                    
-                    # Calcola punti per ordinamento (3 punti per vittoria, 1 per pareggio)
-                    points = (total_wins * 3) + (total_draws * 1)
-                    
-                    # Aggiungi tutte le squadre con i loro punti per ordinamento
-                    all_teams_stats.append({
-                        'Squadra': team,
-                        'PG': total_matches,
-                        'V': total_wins,
-                        'N': total_draws,
-                        'P': total_losses,
-                        'V%': round(win_percentage, 1),
-                        'N%': round(draw_percentage, 1),
-                        'P%': round(loss_percentage, 1),
-                        'PT': points
-                    })
-                
-                if all_teams_stats:
-                    # Converti in DataFrame e ordina per punti (classifica normale)
-                    all_teams_df = pd.DataFrame(all_teams_stats)
-                    all_teams_df = all_teams_df.sort_values(['PT', 'V%'], ascending=[False, False])
-                    
-                    # Ora filtra per soglia percentuale e aggiungi colonna "Gioca"
-                    teams_stats = []
-                    for _, row in all_teams_df.iterrows():
-                        # Determina cosa giocare
-                        play_what = ""
-                        if row['V%'] >= percentage_threshold:
-                            play_what = "V"
-                        elif row['N%'] >= percentage_threshold:
-                            play_what = "N"
-                        elif row['P%'] >= percentage_threshold:
-                            play_what = "P"
-                        
-                        # Aggiungi solo se supera la soglia
-                        if row['V%'] >= percentage_threshold or row['N%'] >= percentage_threshold or row['P%'] >= percentage_threshold:
-                            teams_stats.append({
-                                'Squadra': row['Squadra'],
-                                'PG': row['PG'],
-                                'V': row['V'],
-                                'N': row['N'],
-                                'P': row['P'],
-                                'V%': row['V%'],
-                                'N%': row['N%'],
-                                'P%': row['P%'],
-                                'Gioca': play_what
-                            })
-                
-                if teams_stats:
-                    # Converti in DataFrame
-                    best_teams_df = pd.DataFrame(teams_stats)
-                    
-                    # Ordina per la percentuale più alta tra V%, N%, P%
-                    best_teams_df['Max_Percentage'] = best_teams_df[['V%', 'N%', 'P%']].max(axis=1)
-                    best_teams_df = best_teams_df.sort_values('Max_Percentage', ascending=False)
-                    
-                    # Rimuovi la colonna temporanea
-                    best_teams_df = best_teams_df.drop('Max_Percentage', axis=1)
-                    
+                if not best_teams_df.empty:
                     # Mostra solo le statistiche delle squadre filtrate
                     total_teams = len(best_teams_df)
                     total_matches = best_teams_df['PG'].sum()
@@ -1821,7 +1507,7 @@ elif page == "🏆 Best Teams":
                     show_standings_simple(
                         best_teams_df,
                         "Classifica BEST con Parametri",
-                        matches_df_for_form=matches_df,
+                        matches_df_for_form=best_teams_form_df,
                         standings_type_for_form="total",
                         venue_for_form="TOTALE",
                         form_insert_after="P%",
@@ -1832,6 +1518,12 @@ elif page == "🏆 Best Teams":
                 else:
                     st.warning(f"Nessuna squadra supera la soglia del {percentage_threshold}%")
             
+            # Cubo Under/Over dall'istogramma dei gol calcolato in SQLite
+            best_uo_cube = calculator.cached_result(
+                calculator.result_key("under_over_cube", selected_seasons),
+                lambda: calculator.under_over_cube_from_histogram(db.get_goals_histogram(selected_seasons))
+            )
+            
             with tab3:
                 # Inizializza soglia di default se non presente
                 if 'selected_threshold_best_uo' not in st.session_state:
@@ -1851,7 +1543,7 @@ elif page == "🏆 Best Teams":
                 # Usa la soglia selezionata
                 threshold = st.session_state.selected_threshold_best_uo
                 
-                standings_df = calculator.calculate_under_over_standings(matches_df, threshold)
+                standings_df = calculator.under_over_standings_from_cube(best_uo_cube, threshold)
                 
                 # Filtra solo le squadre con U% o O% >= alla soglia percentuale
                 if not standings_df.empty and 'U%' in standings_df.columns and 'O%' in standings_df.columns:
@@ -1866,49 +1558,13 @@ elif page == "🏆 Best Teams":
                     standings_df = standings_df.drop('Max_Percentage', axis=1)
                     
                     # Aggiungi colonna "ULTIME 5" per Under/Over
-                    def compute_last5_uo_best(team_name: str):
-                        # Prendi tutte le partite della squadra
-                        team_matches = matches_df[(matches_df['home_team'] == team_name) | (matches_df['away_team'] == team_name)].copy()
-                        
-                        # Parse date
-                        team_matches['date_parsed'] = pd.to_datetime(team_matches['date'], errors='coerce')
-                        team_matches = team_matches.dropna(subset=['date_parsed'])
-                        
-                        if team_matches.empty:
-                            return ''
-                        
-                        # Ordina per data (più recente prima)
-                        team_matches = team_matches.sort_values('date_parsed', ascending=False).head(5)
-                        
-                        symbols = []
-                        for _, m in team_matches.iterrows():
-                            # Calcola gol totali
-                            home_goals = pd.to_numeric(m.get('ft_home_goals', 0), errors='coerce') or 0
-                            away_goals = pd.to_numeric(m.get('ft_away_goals', 0), errors='coerce') or 0
-                            total_goals = home_goals + away_goals
-                            
-                            # Determina Over o Under
-                            if total_goals < threshold:
-                                symbols.append('U')  # Under
-                            else:
-                                symbols.append('O')  # Over
-                        
-                        # Render come badge colorati: Verde + per Over, Rosso - per Under
-                        def badge_uo(s):
-                            if s == 'O':
-                                return f"<span style='display:inline-block;background:#28a745;color:white;border-radius:6px;width:24px;height:24px;line-height:24px;text-align:center;font-size:14px;font-weight:600;margin-right:4px;flex-shrink:0;'>+</span>"
-                            else:  # U
-                                return f"<span style='display:inline-block;background:#dc3545;color:white;border-radius:6px;width:24px;height:24px;line-height:24px;text-align:center;font-size:14px;font-weight:600;margin-right:4px;flex-shrink:0;'>-</span>"
-                        
-                        # Avvolgi i badge in un container flex per evitare il wrap verticale
-                        badges_html = ''.join([badge_uo(s) for s in symbols])
-                        return f"<div style='display:flex;flex-wrap:nowrap;white-space:nowrap;align-items:center;'>{badges_html}</div>"
+                    uo_badges = uo_badges_by_team(calculator.calculate_team_form(best_form_matches(standings_df['team']), 5), threshold)
                     
                     # Aggiungi colonna ULTIME 5
                     team_col = 'team' if 'team' in standings_df.columns else ('Squadra' if 'Squadra' in standings_df.columns else None)
                     if team_col:
                         standings_df = standings_df.copy()
-                        standings_df['ULTIME 5'] = standings_df[team_col].apply(compute_last5_uo_best)
+                        standings_df['ULTIME 5'] = standings_df[team_col].map(uo_badges).fillna('')
                 
                 show_standings_simple(standings_df, f"Classifica BEST Under/Over {threshold}")
             
@@ -1942,55 +1598,12 @@ elif page == "🏆 Best Teams":
                 # Usa solo le soglie selezionate (se nessuna è selezionata, usa tutte)
                 selected_thresholds = st.session_state.selected_thresholds_uo_totale if st.session_state.selected_thresholds_uo_totale else available_thresholds
                 
-                # Calcola statistiche per ogni squadra solo sulle soglie selezionate
-                teams_stats_all = []
-                
-                for team in matches_df['home_team'].unique():
-                    team_stats = {}
-                    best_threshold = None
-                    best_percentage = 0
-                    best_type = None  # 'O' o 'U'
-                    
-                    # Calcola solo per le soglie selezionate
-                    for th in selected_thresholds:
-                        stats = calculator._calculate_under_over_stats(matches_df, team, th, "TOTALE", "TOTALE")
-                        if stats:
-                            pg = stats.get('PG', 0)
-                            if pg > 0:
-                                u_perc = (stats.get('U', 0) / pg) * 100
-                                o_perc = (stats.get('O', 0) / pg) * 100
-                                
-                                # Tiene la % più alta tra U e O
-                                if u_perc > best_percentage:
-                                    best_percentage = u_perc
-                                    best_threshold = th
-                                    best_type = 'U'
-                                if o_perc > best_percentage:
-                                    best_percentage = o_perc
-                                    best_threshold = th
-                                    best_type = 'O'
-                    
-                    # Se supera la soglia percentuale globale
-                    if best_percentage >= percentage_threshold:
-                        team_stats = calculator._calculate_under_over_stats(matches_df, team, best_threshold, "TOTALE", "TOTALE")
-                        if team_stats:
-                            team_stats['Squadra'] = team
-                            team_stats['PG'] = team_stats.get('PG', 0)
-                            team_stats['U'] = team_stats.get('U', 0)
-                            team_stats['O'] = team_stats.get('O', 0)
-                            team_stats['U%'] = round((team_stats['U'] / team_stats['PG']) * 100, 2) if team_stats['PG'] > 0 else 0
-                            team_stats['O%'] = round((team_stats['O'] / team_stats['PG']) * 100, 2) if team_stats['PG'] > 0 else 0
-                            team_stats['Pron'] = best_threshold
-                            team_stats['Gioca'] = best_type
-                            team_stats['%'] = round(best_percentage, 2)
-                            
-                            teams_stats_all.append(team_stats)
+                # Migliore soglia per squadra letta dal cubo (nessun ricalcolo per soglia)
+                best_uo_df = calculator.calculate_best_under_over(best_uo_cube, selected_thresholds)
+                if not best_uo_df.empty:
+                    best_uo_df = best_uo_df[best_uo_df['%'] >= percentage_threshold].rename(columns={'team': 'Squadra'})
                 
-                if teams_stats_all:
-                    best_uo_df = pd.DataFrame(teams_stats_all)
-                    # Ordina per % decrescente
-                    best_uo_df = best_uo_df.sort_values('%', ascending=False)
-                    
+                if not best_uo_df.empty:
                     # Mostra metriche: Squadre, Partite Totali, Media Gol/Partita
                     col1, col2, col3 = st.columns(3)
                     with col1:
@@ -2013,49 +1626,12 @@ elif page == "🏆 Best Teams":
                         st.metric("Media Gol/Partita", avg_goals)
                     
                     # Aggiungi colonna "ULTIME 5" per Under/Over
-                    def badge_uo(s):
-                        if s == 'O':
-                            return f"<span style='display:inline-block;background:#28a745;color:white;border-radius:6px;width:24px;height:24px;line-height:24px;text-align:center;font-size:14px;font-weight:600;margin-right:4px;flex-shrink:0;'>+</span>"
-                        else:  # U
-                            return f"<span style='display:inline-block;background:#dc3545;color:white;border-radius:6px;width:24px;height:24px;line-height:24px;text-align:center;font-size:14px;font-weight:600;margin-right:4px;flex-shrink:0;'>-</span>"
-                    
-                    def compute_last5_uo_totale(row):
-                        team_name = row['Squadra']
-                        best_threshold = row['Pron']
-                        
-                        # Prendi tutte le partite della squadra
-                        team_matches = matches_df[(matches_df['home_team'] == team_name) | (matches_df['away_team'] == team_name)].copy()
-                        
-                        # Parse date
-                        team_matches['date_parsed'] = pd.to_datetime(team_matches['date'], errors='coerce')
-                        team_matches = team_matches.dropna(subset=['date_parsed'])
-                        
-                        if team_matches.empty:
-                            return ''
-                        
-                        # Ordina per data (più recente prima)
-                        team_matches = team_matches.sort_values('date_parsed', ascending=False).head(5)
-                        
-                        symbols = []
-                        for _, m in team_matches.iterrows():
-                            # Calcola gol totali
-                            home_goals = pd.to_numeric(m.get('ft_home_goals', 0), errors='coerce') or 0
-                            away_goals = pd.to_numeric(m.get('ft_away_goals', 0), errors='coerce') or 0
-                            total_goals = home_goals + away_goals
-                            
-                            # Determina Over o Under usando la soglia migliore per questa squadra
-                            if total_goals < best_threshold:
-                                symbols.append('U')  # Under
-                            else:
-                                symbols.append('O')  # Over
-                        
-                        # Render come badge colorati: Verde + per Over, Rosso - per Under
-                        # Avvolgi i badge in un container flex per evitare il wrap verticale
-                        badges_html = ''.join([badge_uo(s) for s in symbols])
-                        return f"<div style='display:flex;flex-wrap:nowrap;white-space:nowrap;align-items:center;'>{badges_html}</div>"
-                    
-                    # Aggiungi colonna ULTIME 5
-                    best_uo_df['ULTIME 5'] = best_uo_df.apply(compute_last5_uo_totale, axis=1)
+                    # Ogni squadra usa la propria soglia migliore (colonna Pron)
+                    uo_badges = uo_badges_by_team(
+                        calculator.calculate_team_form(best_form_matches(best_uo_df['Squadra']), 5),
+                        dict(zip(best_uo_df['Squadra'], best_uo_df['Pron']))
+                    )
+                    best_uo_df['ULTIME 5'] = best_uo_df['Squadra'].map(uo_badges).fillna('')
                     
                     # Mostra solo le colonne necessarie (incluse ULTIME 5)
                     display_df = best_uo_df[['Squadra', 'PG', 'U', 'O', 'U%', 'O%', 'Pron', 'Gioca', '%', 'ULTIME 5']]
@@ -69,15 +69,6 @@ COLUMN_MAPPINGS = {
         'b365d': 'b365_draw',
         'b365a': 'b365_away'
     },
-    "extended": {
-        # Include tutte le colonne standard più quelle aggiuntive
-        **COLUMN_MAPPINGS["standard"],
-        'bfh': 'bf_home',  # Nuove colonne per file 2024-2025+
-        'bfd': 'bf_draw',
-        'bfa': 'bf_away',
-        'bfdh': 'bf_draw_home',
-        'bfda': 'bf_draw_away'
-    },
     "custom": {
         # Per new_leagues_data - struttura personalizzata
         'division': 'div',
@@ -94,6 +85,17 @@ COLUMN_MAPPINGS = {
     }
 }
 
+# Include tutte le colonne standard più quelle aggiuntive
+# (definita dopo il dizionario perché riusa la mappatura "standard")
+COLUMN_MAPPINGS["extended"] = {
+    **COLUMN_MAPPINGS["standard"],
+    'bfh': 'bf_home',  # Nuove colonne per file 2024-2025+
+    'bfd': 'bf_draw',
+    'bfa': 'bf_away',
+    'bfdh': 'bf_draw_home',
+    'bfda': 'bf_draw_away'
+}
+
 # Configurazione per la gestione delle stagioni
 SEASON_CONFIG = {
     "current_year": 2024,
@@ -118,6 +120,19 @@ STANDINGS_CONFIG = {
 # Configurazione per le soglie Under/Over
 UNDER_OVER_THRESHOLDS = [0.5, 1.5, 2.5, 3.5, 4.5, 5.5, 6.5, 7.5, 8.5]
 
+# Filtri della pagina Under/Over: etichetta -> (venue, tempo)
+UNDER_OVER_FILTERS = {
+    "Totale": ("TOTALE", "TOTALE"),
+    "Casa": ("CASA", "TOTALE"),
+    "Fuori": ("FUORI", "TOTALE"),
+    "I Tempo": ("TOTALE", "I TEMPO"),
+    "Casa I Tempo": ("CASA", "I TEMPO"),
+    "Fuori I Tempo": ("FUORI", "I TEMPO"),
+    "II Tempo": ("TOTALE", "II TEMPO"),
+    "Casa II Tempo": ("CASA", "II TEMPO"),
+    "Fuori II Tempo": ("FUORI", "II TEMPO")
+}
+
 # Configurazione per il sistema bonus/malus
 BONUS_MALUS_CONFIG = {
     "achievement_penalties": {
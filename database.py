@@ -6,6 +6,16 @@ import os
 import logging
 from pathlib import Path
 import re
+import hashlib
+import itertools
+import json
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import load_workbook
 try:
     import streamlit as st
     STREAMLIT_AVAILABLE = True
@@ -155,21 +165,881 @@ def get_division_display_name(name: str) -> str:
     key = str(name).strip()
     return DIVISION_DISPLAY_MAP.get(key, key)
 
+# ============================================================================
+# VISTA PER SQUADRA - tabella team_matches (due righe per partita)
+# ============================================================================
+
+# SELECT che produce le righe di una squadra (casa o trasferta) a partire da matches
+_TEAM_MATCHES_SIDE_SELECT = """
+    SELECT id, div_key, season_key, match_date, {team}, {opponent}, '{venue}',
+           {gf}, {ga}, {ht_gf}, {ht_ga}, {gf} - {ht_gf}, {ga} - {ht_ga},
+           CASE WHEN {gf} > {ga} THEN 'V' WHEN {gf} = {ga} THEN 'N' WHEN {gf} < {ga} THEN 'P' END,
+           CASE WHEN {gf} > {ga} THEN 3 WHEN {gf} = {ga} THEN 1 WHEN {gf} < {ga} THEN 0 END
+    FROM matches
+    WHERE id > ?
+"""
+
+TEAM_MATCHES_INSERT_SQL = (
+    """
+    INSERT INTO team_matches (
+        match_id, div, season, date, team, opponent, venue,
+        ft_gf, ft_ga, ht_gf, ht_ga, sh_gf, sh_ga, outcome, points
+    )
+    """
+    + _TEAM_MATCHES_SIDE_SELECT.format(
+        team='home_team', opponent='away_team', venue='CASA',
+        gf='ft_home_goals', ga='ft_away_goals', ht_gf='ht_home_goals', ht_ga='ht_away_goals'
+    )
+    + "UNION ALL"
+    + _TEAM_MATCHES_SIDE_SELECT.format(
+        team='away_team', opponent='home_team', venue='FUORI',
+        gf='ft_away_goals', ga='ft_home_goals', ht_gf='ht_away_goals', ht_ga='ht_home_goals'
+    )
+)
+
+# Versione dei dati: incrementata da ogni operazione che modifica le partite
+# (import, eliminazione file, normalizzazione stagioni); invalida le cache dei risultati
+DATA_VERSION_BUMP_SQL = """
+    INSERT INTO app_metrics(key, value) VALUES('data_version', 1)
+    ON CONFLICT(key) DO UPDATE SET value = value + 1
+"""
+
+# ============================================================================
+# CLASSIFICHE AGGREGATE - tabella standings_agg (div, season, team, venue, half)
+# ============================================================================
+
+# Regole di normalizzazione delle stagioni, nell'ordine in cui vengono applicate
+SEASON_NORMALIZATION_RULES = ('trimmed', 'dot_separator', 'slash_separator', 'single_year')
+
+def _season_rules(season):
+    """Stagione normalizzata e regole di SEASON_NORMALIZATION_RULES che l'hanno cambiata"""
+    testo = str(season)
+    s = testo.strip()
+    regole = [
+        regola for regola, applicata in (
+            ('trimmed', s != testo), ('dot_separator', '.' in s), ('slash_separator', '/' in s)
+        ) if applicata
+    ]
+    s = s.replace('.', '-').replace('/', '-')
+    if s.isdigit() and len(s) == 4:
+        anno = int(s)
+        s = f"{anno}-{anno+1}"
+        regole.append('single_year')
+    return s, regole
+
+def _normalize_season_label(season):
+    """Normalizza una stagione come in get_matches_data ('.' e '/' -> '-', 2021 -> 2021-2022)"""
+    return _season_rules(season)[0]
+
+def _season_key(season):
+    """Stagione canonica per la colonna season_key (registrata in SQLite come normalize_season)"""
+    if season is None:
+        return None
+    return _normalize_season_label(season)
+
+def _season_start(season_key):
+    """Anno di inizio di una stagione canonica YYYY-YYYY (colonna season_start), None per le altre"""
+    if season_key is None:
+        return None
+    m = re.fullmatch(r'(\d{4})-\d{4}', str(season_key))
+    return int(m.group(1)) if m else None
+
+# Formati testuali accettati per le date delle partite (giorno prima del mese, come nei file)
+MATCH_DATE_FORMATS = ('%d/%m/%Y', '%d/%m/%y', '%d.%m.%Y', '%d-%m-%Y')
+
+def parse_match_dates(values):
+    """Interpreta le date delle partite: Timestamp di Excel, testo ISO (YYYY-MM-DD[ hh:mm:ss])
+    o testo giorno/mese/anno. Ritorna una Series datetime64 senza orario (NaT se non valida).
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.normalize()
+    text = values.astype(str).str.strip()
+    iso = text.str.match(r'\d{4}-\d{2}-\d{2}')
+    parsed = pd.to_datetime(text.where(iso).str[:10], format='%Y-%m-%d', errors='coerce')
+    for fmt in MATCH_DATE_FORMATS:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(text[missing], format=fmt, errors='coerce')
+    return parsed
+
+def match_day_numbers(parsed):
+    """Numero del giorno (giorni dal 1970-01-01) di date già interpretate, Int64 con NA"""
+    return ((parsed - pd.Timestamp('1970-01-01')).dt.days).astype('Int64')
+
+# Chiave di deduplica di una partita: squadre senza spazi + data ISO (testo originale se non
+# interpretabile). MATCH_KEY_SQL e _match_keys devono produrre lo stesso valore
+MATCH_KEY_SQL = "TRIM(home_team) || '|' || TRIM(away_team) || '|' || COALESCE(match_date, TRIM(date))"
+
+def _match_keys(df):
+    """Chiavi di deduplica (colonna match_key) delle partite da importare, come MATCH_KEY_SQL"""
+    date_text = df['date'].astype(str).str.strip()
+    return (
+        df['home_team'].astype(str).str.strip() + '|'
+        + df['away_team'].astype(str).str.strip() + '|'
+        + df['match_date'].fillna(date_text).astype(str)
+    )
+
+# Normalizzazione delle stagioni salvate: una sola UPDATE sulle righe che cambiano davvero.
+# I GLOB scartano in SQL le stagioni già canoniche (solo cifre e trattini, non un anno singolo)
+# prima di chiamare le funzioni Python; normalize_season_counted conta le regole applicate
+SEASON_NORMALIZE_SQL = """
+    UPDATE matches
+    SET season = normalize_season_counted(season)
+    WHERE (season GLOB '*[^0-9-]*' OR season GLOB '[0-9][0-9][0-9][0-9]')
+      AND season IS NOT normalize_season(season)
+"""
+
+# Colonne chiave di matches: stagione canonica, anno di inizio e campionato senza spazi.
+# Calcolate una volta all'import (e dalla migrazione) così i filtri usano le colonne nude
+MATCH_KEYS_UPDATE_SQL = """
+    UPDATE matches
+    SET season_key = normalize_season(season),
+        season_start = season_start_year(normalize_season(season)),
+        div_key = NULLIF(TRIM(div), '')
+    WHERE id > ?
+"""
+
+# Dizionari di squadre e campionati (tabelle teams e divisions): ogni nome una volta con un id
+# intero, salvato nelle partite in home_team_id/away_team_id/div_id. Eseguite in quest'ordine
+# sulle partite con id > ? (dopo MATCH_KEYS_UPDATE_SQL, che calcola div_key)
+MATCH_DIMENSIONS_SQL = (
+    """
+    INSERT OR IGNORE INTO teams (name)
+    SELECT home_team FROM matches WHERE id > ?1 AND home_team IS NOT NULL
+    UNION
+    SELECT away_team FROM matches WHERE id > ?1 AND away_team IS NOT NULL
+    """,
+    """
+    INSERT OR IGNORE INTO divisions (code)
+    SELECT DISTINCT div_key FROM matches WHERE id > ?1 AND div_key IS NOT NULL
+    """,
+    """
+    UPDATE matches
+    SET home_team_id = (SELECT id FROM teams WHERE teams.name = matches.home_team),
+        away_team_id = (SELECT id FROM teams WHERE teams.name = matches.away_team),
+        div_id = (SELECT id FROM divisions WHERE divisions.code = matches.div_key)
+    WHERE id > ?1
+    """
+)
+
+def _update_match_dimensions(cursor, ultimo_id):
+    """Registra squadre e campionati nuovi e salva gli id nelle partite con id > ultimo_id"""
+    for sql in MATCH_DIMENSIONS_SQL:
+        cursor.execute(sql, (ultimo_id,))
+
+# Colonne lette come id e decodificate dai dizionari in get_matches_data(columns=...)
+_MATCH_DIMENSION_COLUMNS = {
+    'home_team': ('home_team_id', 'teams', 'name'),
+    'away_team': ('away_team_id', 'teams', 'name'),
+    'div_key': ('div_id', 'divisions', 'code')
+}
+
+# Righe di team_matches per un tempo: solo partite con il risultato finale e i gol di quel
+# tempo, come calculate_standings e get_goals_histogram
+_STANDINGS_AGG_HALF_SELECT = """
+    SELECT COALESCE(div, '') AS div, COALESCE(season, '') AS season, COALESCE(team, '') AS team,
+           venue, '{half}' AS half, {gf} AS gf, {ga} AS ga
+    FROM team_matches
+    WHERE {where} AND ft_gf IS NOT NULL AND ft_ga IS NOT NULL
+      AND {gf} IS NOT NULL AND {ga} IS NOT NULL
+"""
+
+# Versione del calcolo di standings_agg (chiave 'standings_agg_version' in app_metrics):
+# quando cambia, init_database ricostruisce la tabella una volta
+STANDINGS_AGG_VERSION = 2
+
+def _standings_agg_delta_sql(where):
+    """SELECT con i contatori (PG, V, N, P, GF, GS) delle righe team_matches che soddisfano `where`.
+    Il filtro compare una volta per tempo: i parametri vanno passati tre volte.
+    """
+    halves = "UNION ALL".join(
+        _STANDINGS_AGG_HALF_SELECT.format(half=half, gf=gf, ga=ga, where=where)
+        for half, gf, ga in (
+            ('TOTALE', 'ft_gf', 'ft_ga'),
+            ('I TEMPO', 'ht_gf', 'ht_ga'),
+            ('II TEMPO', 'sh_gf', 'sh_ga'),
+        )
+    )
+    return f"""
+        SELECT div, season, team, venue, half,
+               COUNT(*) AS pg, SUM(gf > ga) AS v, SUM(gf = ga) AS n, SUM(gf < ga) AS p,
+               SUM(gf) AS gf, SUM(ga) AS gs
+        FROM ({halves})
+        WHERE true
+        GROUP BY div, season, team, venue, half
+    """
+
+# Somma i contatori delle partite con id > ? (parametri: ultimo id, ripetuto tre volte)
+STANDINGS_AGG_UPSERT_SQL = (
+    "INSERT INTO standings_agg (div, season, team, venue, half, pg, v, n, p, gf, gs)"
+    + _standings_agg_delta_sql("match_id > ?")
+    + """
+    ON CONFLICT(div, season, team, venue, half) DO UPDATE SET
+        pg = pg + excluded.pg, v = v + excluded.v, n = n + excluded.n, p = p + excluded.p,
+        gf = gf + excluded.gf, gs = gs + excluded.gs
+    """
+)
+
+# Sottrae i contatori delle partite di un lotto di import (parametri: batch_id, ripetuto tre volte)
+STANDINGS_AGG_DECREMENT_SQL = (
+    """
+    UPDATE standings_agg
+    SET pg = standings_agg.pg - d.pg, v = standings_agg.v - d.v, n = standings_agg.n - d.n,
+        p = standings_agg.p - d.p, gf = standings_agg.gf - d.gf, gs = standings_agg.gs - d.gs
+    FROM ("""
+    + _standings_agg_delta_sql("match_id IN (SELECT id FROM matches WHERE batch_id = ?)")
+    + """) AS d
+    WHERE standings_agg.div = d.div AND standings_agg.season = d.season
+      AND standings_agg.team = d.team AND standings_agg.venue = d.venue
+      AND standings_agg.half = d.half
+    """
+)
+
+# ============================================================================
+# RIEPILOGO DATI - tabella dataset_summary (stagione, campionato, file)
+# ============================================================================
+
+# Conteggi e prima/ultima data delle partite con id > ?, sommati alle righe già presenti.
+# Le chiavi mancanti diventano '' (NULL nella chiave primaria non farebbe scattare il conflitto)
+DATASET_SUMMARY_UPSERT_SQL = """
+    INSERT INTO dataset_summary (season, div, file_source, matches, first_date, last_date)
+    SELECT COALESCE(season_key, ''), COALESCE(div_key, ''), COALESCE(file_source, ''),
+           COUNT(*), MIN(match_date), MAX(match_date)
+    FROM matches
+    WHERE id > ?
+    GROUP BY 1, 2, 3
+    ON CONFLICT(season, div, file_source) DO UPDATE SET
+        matches = matches + excluded.matches,
+        first_date = COALESCE(MIN(first_date, excluded.first_date), first_date, excluded.first_date),
+        last_date = COALESCE(MAX(last_date, excluded.last_date), last_date, excluded.last_date)
+"""
+
+# Raggruppamenti ammessi da get_dataset_summary
+DATASET_SUMMARY_GROUPS = ('season', 'div', 'file_source')
+
+# ============================================================================
+# LOTTI DI IMPORT - tabella import_batches (un lotto per ogni import di un file)
+# ============================================================================
+
+# Chiude un lotto: conteggi dell'import e, dalle partite rimaste (indice su batch_id),
+# numero di partite e prime/ultime stagioni (parametri: letti, nuove, doppie, scartate, id)
+IMPORT_BATCH_FINISH_SQL = """
+    UPDATE import_batches
+    SET rows_read = ?, inserted = ?, duplicates = ?, discarded = ?,
+        matches = (SELECT COUNT(*) FROM matches WHERE batch_id = import_batches.id),
+        first_season = (SELECT MIN(season_key) FROM matches WHERE batch_id = import_batches.id),
+        last_season = (SELECT MAX(season_key) FROM matches WHERE batch_id = import_batches.id),
+        finished_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+"""
+
+# Migrazione: un lotto per ogni file già importato, con le date di import delle sue partite
+IMPORT_BATCHES_MIGRATION_SQL = (
+    """
+    INSERT INTO import_batches (file_name, inserted, matches, first_season, last_season, started_at, finished_at)
+    SELECT file_source, COUNT(*), COUNT(*), MIN(season_key), MAX(season_key), MIN(import_date), MAX(import_date)
+    FROM matches
+    WHERE file_source IS NOT NULL
+    GROUP BY file_source
+    ORDER BY MIN(id)
+    """,
+    """
+    UPDATE matches
+    SET batch_id = (SELECT id FROM import_batches WHERE import_batches.file_name = matches.file_source)
+    WHERE file_source IS NOT NULL
+    """,
+)
+
+# Tipi delle colonne restituite da get_matches_data: gol e statistiche come interi piccoli
+# con NA, squadre/campionato/stagione come categorie (poche etichette ripetute molte volte)
+_MATCH_COUNT_COLUMNS = (
+    'ft_home_goals', 'ft_away_goals', 'ht_home_goals', 'ht_away_goals',
+    'home_shots', 'away_shots', 'home_shots_target', 'away_shots_target',
+    'home_fouls', 'away_fouls', 'home_corners', 'away_corners',
+    'home_yellow', 'away_yellow', 'home_red', 'away_red'
+)
+MATCH_COLUMN_DTYPES = {
+    **{col: 'Int16' for col in _MATCH_COUNT_COLUMNS},
+    'season_start': 'Int16',
+    'match_day': 'Int32',
+    **{col: 'category' for col in ('div', 'season', 'div_key', 'season_key', 'home_team', 'away_team')}
+}
+
+# Colonne che servono alle pagine (classifiche, Under/Over, forma, fasi, scontri diretti)
+MATCH_RESULT_COLUMNS = (
+    'id', 'div_key', 'season_key', 'date', 'match_day', 'home_team', 'away_team',
+    'ft_home_goals', 'ft_away_goals', 'ft_result', 'ht_home_goals', 'ht_away_goals', 'ht_result'
+)
+
+def apply_match_dtypes(df):
+    """Converte le colonne presenti secondo MATCH_COLUMN_DTYPES. home_team e away_team
+    condividono le stesse categorie (in ordine alfabetico), così confronti, concat e
+    ordinamenti tra le due colonne si comportano come con il testo.
+    """
+    team_columns = [col for col in ('home_team', 'away_team') if col in df.columns]
+    if team_columns:
+        teams = pd.concat([df[col] for col in team_columns]).dropna().unique()
+        team_dtype = pd.CategoricalDtype(sorted(teams))
+    for col, dtype in MATCH_COLUMN_DTYPES.items():
+        if col not in df.columns:
+            continue
+        if col in team_columns:
+            df[col] = df[col].astype(team_dtype)
+        elif dtype == 'category':
+            df[col] = df[col].astype('category').cat.remove_unused_categories()
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    return df
+
+def _decode_dimension(ids, dizionario):
+    """Id di un dizionario (DataFrame id, nome) -> Categorical con i nomi, senza passare dal testo"""
+    posizioni = np.full(int(dizionario['id'].max()) + 1 if len(dizionario) else 1, -1)
+    posizioni[dizionario['id'].to_numpy()] = np.arange(len(dizionario))
+    valori = pd.to_numeric(ids, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    validi = ~np.isnan(valori) & (valori >= 0) & (valori < len(posizioni))
+    codici = np.full(len(valori), -1)
+    codici[validi] = posizioni[valori[validi].astype(np.int64)]
+    return pd.Categorical.from_codes(codici, categories=dizionario.iloc[:, 1].rename(None))
+
+# ============================================================================
+# IMPORT - normalizzazione a blocchi (funzioni di modulo, senza connessione)
+# ============================================================================
+
+# Righe lette per blocco dai CSV: la memoria dell'import dipende da questo valore, non dal file
+IMPORT_CHUNK_ROWS = 20000
+
+def rileva_mappatura_colonne(colonne):
+    """Analizza le colonne del file e prova a rilevare quale mappatura usare"""
+    colonne_file = set(colonne)
+
+    migliore_match = None
+    max_corrispondenze = 0
+
+    for nome_mappatura, mappatura in MAPPATURE_DISPONIBILI.items():
+        colonne_mappatura = set(mappatura.keys())
+        corrispondenze = len(colonne_file.intersection(colonne_mappatura))
+
+        if corrispondenze > max_corrispondenze:
+            max_corrispondenze = corrispondenze
+            migliore_match = nome_mappatura
+
+    percentuale = (max_corrispondenze / len(colonne_file)) * 100 if len(colonne_file) > 0 else 0
+
+    logger.info(f"Mappatura rilevata: {migliore_match} ({max_corrispondenze}/{len(colonne_file)} colonne - {percentuale:.1f}%)")
+
+    return migliore_match
+
+def _converti_stagione(stagione_str):
+    """Normalizza separatori e, se anno singolo (es: 2021) → 2021-2022"""
+    if pd.isna(stagione_str) or stagione_str == 'None':
+        return None
+
+    stagione_str = str(stagione_str).strip()
+    # Normalizza separatori: punto o slash → trattino
+    stagione_str = stagione_str.replace('/', '-').replace('.', '-')
+
+    # Se contiene già il trattino, è già in formato corretto
+    if '-' in stagione_str:
+        return stagione_str
+
+    # Se è un anno singolo (4 cifre), convertilo
+    if stagione_str.isdigit() and len(stagione_str) == 4:
+        anno = int(stagione_str)
+        return f"{anno}-{anno + 1}"
+
+    return stagione_str
+
+def normalize_import_chunk(df, nome_file, mappatura_nome, season=None):
+    """Porta un blocco di righe lette dal file nel formato della tabella matches.
+
+    Applica mappatura colonne, campionato (con fallback al nome foglio), stagione,
+    scarto delle stagioni <= 2019-2020, data ISO/numero del giorno e match_key.
+    Non usa il database: può girare in un altro processo.
+    Ritorna (DataFrame normalizzato, conteggi rows_read/discarded_seasons/invalid_dates).
+    """
+    mappatura = MAPPATURE_DISPONIBILI[mappatura_nome]
+    stats = {'rows_read': len(df), 'discarded_seasons': 0, 'invalid_dates': 0}
+
+    # Crea DataFrame normalizzato applicando la mappatura
+    df_normalizzato = pd.DataFrame(index=df.index)
+    for colonna_orig, colonna_dest in mappatura.items():
+        if colonna_orig in df.columns:
+            df_normalizzato[colonna_dest] = df[colonna_orig]
+        else:
+            df_normalizzato[colonna_dest] = None
+
+    # Normalizza il nome campionato e fallback al nome foglio se mancante
+    if 'div' in df_normalizzato.columns:
+        df_normalizzato['div'] = df_normalizzato['div'].astype(str).str.strip()
+        if '__sheet_name' in df.columns:
+            mask_missing_div = df_normalizzato['div'].isna() | (df_normalizzato['div'] == '') | (df_normalizzato['div'].str.lower() == 'none')
+            df_normalizzato.loc[mask_missing_div, 'div'] = df.loc[mask_missing_div, '__sheet_name'].astype(str).str.strip()
+
+    # GESTIONE STAGIONE
+    # Regola richiesta: per i file standard "all-euro-data-YYYY-YYYY" usare SEMPRE la stagione dal nome file
+    if mappatura_nome == 'standard':
+        match = re.search(r'(\d{4})-(\d{4})', nome_file)
+        if match:
+            stagione_estratta = f"{match.group(1)}-{match.group(2)}"
+            df_normalizzato['season'] = stagione_estratta
+            logger.debug(f"[standard] Stagione forzata dal nome file: {stagione_estratta}")
+        else:
+            # fallback: come prima
+            stagione_mancante = ('season' not in df_normalizzato.columns) or (df_normalizzato['season'].isna().all())
+            if stagione_mancante:
+                if season:
+                    df_normalizzato['season'] = season
+                    logger.debug(f"Stagione impostata manualmente: {season}")
+                else:
+                    df_normalizzato['season'] = None
+                    logger.warning("Impossibile determinare la stagione (standard, no match nel nome file)")
+    else:
+        # Comportamento precedente: se manca, prova da parametro o nome file
+        stagione_mancante = ('season' not in df_normalizzato.columns) or (df_normalizzato['season'].isna().all())
+        if stagione_mancante:
+            if season:
+                df_normalizzato['season'] = season
+                logger.debug(f"Stagione impostata manualmente: {season}")
+            else:
+                match = re.search(r'(\d{4})-(\d{4})', nome_file)
+                if match:
+                    stagione_estratta = f"{match.group(1)}-{match.group(2)}"
+                    df_normalizzato['season'] = stagione_estratta
+                    logger.debug(f"Stagione estratta dal nome file: {stagione_estratta}")
+                else:
+                    df_normalizzato['season'] = None
+                    logger.warning("Impossibile determinare la stagione!")
+
+    # Aggiungi metadata
+    df_normalizzato['file_source'] = nome_file
+
+    # Rimuovi righe vuote
+    df_normalizzato = df_normalizzato.dropna(subset=['home_team', 'away_team'])
+
+    # CONVERSIONE STAGIONE: normalizza separatori e, se anno singolo (es: 2021) → 2021-2022
+    df_normalizzato['season'] = df_normalizzato['season'].apply(_converti_stagione)
+
+    # FILTRO STAGIONI VECCHIE (scarta <= 2019-2020 e mancanti)
+    valide = df_normalizzato['season'].notna() & (df_normalizzato['season'] > '2019-2020')
+    stats['discarded_seasons'] = int((~valide).sum())
+    df_normalizzato = df_normalizzato[valide]
+
+    # DATA PARTITA: interpretata una sola volta (data ISO + numero del giorno)
+    # per ordinamenti e "ultime N" senza riconvertire il testo ad ogni pagina
+    date_parsed = parse_match_dates(df_normalizzato['date'])
+    df_normalizzato = df_normalizzato.assign(
+        match_date=date_parsed.dt.strftime('%Y-%m-%d'),
+        match_day=match_day_numbers(date_parsed)
+    )
+    stats['invalid_dates'] = int(date_parsed.isna().sum())
+
+    # Converti le date in stringhe
+    for col in ['date', 'time', 'season']:
+        df_normalizzato[col] = df_normalizzato[col].astype(str)
+
+    # Chiave di deduplica (indice UNIQUE su match_key)
+    df_normalizzato['match_key'] = _match_keys(df_normalizzato)
+
+    return df_normalizzato, stats
+
+def _insert_new_matches(cursor, df):
+    """Inserisce le partite di un blocco normalizzato: quelle con una match_key già presente
+    vengono saltate dall'indice UNIQUE. Ritorna il numero di righe davvero inserite.
+    """
+    columns = ', '.join(f'"{c}"' for c in df.columns)
+    placeholders = ', '.join('?' for _ in df.columns)
+    righe = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    cursor.executemany(
+        f'INSERT INTO matches ({columns}) VALUES ({placeholders}) ON CONFLICT(match_key) DO NOTHING',
+        righe
+    )
+    return cursor.rowcount
+
+def _excel_header(valori):
+    """Nomi colonna dalla prima riga di un foglio, come pd.read_excel: celle vuote
+    'Unnamed: N' e nomi ripetuti con suffisso '.1', '.2', ...
+    """
+    nomi = []
+    visti = {}
+    for posizione, valore in enumerate(valori):
+        nome = f'Unnamed: {posizione}' if valore is None else valore
+        if nome in visti:
+            visti[nome] += 1
+            nome = f'{nome}.{visti[nome]}'
+        else:
+            visti[nome] = 0
+        nomi.append(nome)
+    return nomi
+
+def iter_excel_chunks(file_path, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Legge una cartella Excel in un solo passaggio: (DataFrame, frazione già letta).
+
+    Gli .xlsx sono letti in streaming con openpyxl in sola lettura, foglio dopo foglio, a
+    blocchi di `chunk_rows` righe; gli altri formati (.xls) aprendo il file una volta sola.
+    Ogni blocco ha la colonna '__sheet_name' per l'eventuale fallback del campionato.
+    """
+    if not file_path.lower().endswith(('.xlsx', '.xlsm')):
+        excel_file = pd.ExcelFile(file_path)
+        fogli = excel_file.sheet_names
+        logger.info(f"File Excel caricato - Fogli: {len(fogli)}")
+        for indice, sheet_name in enumerate(fogli, start=1):
+            df_sheet = excel_file.parse(sheet_name)
+            df_sheet['__sheet_name'] = str(sheet_name)
+            logger.info(f"Foglio {sheet_name}: {len(df_sheet)} righe")
+            yield df_sheet, indice / len(fogli)
+        return
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        fogli = workbook.worksheets
+        logger.info(f"File Excel caricato - Fogli: {len(fogli)}")
+        for indice, worksheet in enumerate(fogli):
+            righe = worksheet.iter_rows(values_only=True)
+            intestazione = next(righe, None)
+            if intestazione is None:
+                logger.info(f"Foglio {worksheet.title}: vuoto")
+                continue
+            colonne = _excel_header(intestazione)
+            # Righe previste dal foglio (dimensione dichiarata) per l'avanzamento
+            totale = max((worksheet.max_row or 1) - 1, 1)
+            lette = scorse = 0
+            larghezza = len(colonne)
+            while True:
+                grezze = list(itertools.islice(righe, chunk_rows))
+                if not grezze:
+                    break
+                # Righe completamente vuote scartate (come pd.read_excel), le altre
+                # portate alla larghezza dell'intestazione
+                blocco = [
+                    tuple(riga[:larghezza]) + (None,) * (larghezza - len(riga))
+                    for riga in grezze if any(valore is not None for valore in riga)
+                ]
+                scorse += len(grezze)
+                del grezze
+                if not blocco:
+                    continue
+                df_chunk = pd.DataFrame(blocco, columns=colonne, index=pd.RangeIndex(lette, lette + len(blocco)))
+                df_chunk['__sheet_name'] = str(worksheet.title)
+                lette += len(blocco)
+                yield df_chunk, min((indice + min(scorse / totale, 1.0)) / len(fogli), 1.0)
+            logger.info(f"Foglio {worksheet.title}: {lette} righe")
+    finally:
+        workbook.close()
+
+def iter_import_chunks(file_path, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Legge il file da importare a blocchi: (DataFrame, frazione del file già letta).
+    I CSV vengono letti a `chunk_rows` righe alla volta; gli Excel in un solo passaggio
+    sulla cartella (vedi iter_excel_chunks).
+    """
+    if file_path.endswith('.csv'):
+        dimensione = max(os.path.getsize(file_path), 1)
+        with open(file_path, 'rb') as handle:
+            for chunk in pd.read_csv(handle, chunksize=chunk_rows):
+                yield chunk, min(handle.tell() / dimensione, 1.0)
+    else:
+        yield from iter_excel_chunks(file_path, chunk_rows)
+
+def read_import_columns(file_path):
+    """Colonne del file senza leggerne le righe, per rilevare la mappatura: l'intestazione
+    del CSV oppure l'unione delle intestazioni di tutti i fogli Excel più '__sheet_name'
+    (le colonne che aveva il DataFrame con i fogli concatenati).
+    """
+    if file_path.endswith('.csv'):
+        return list(pd.read_csv(file_path, nrows=0).columns)
+
+    if not file_path.lower().endswith(('.xlsx', '.xlsm')):
+        excel_file = pd.ExcelFile(file_path)
+        intestazioni = [excel_file.parse(sheet_name, nrows=0).columns for sheet_name in excel_file.sheet_names]
+    else:
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            intestazioni = [
+                _excel_header(intestazione)
+                for worksheet in workbook.worksheets
+                for intestazione in itertools.islice(worksheet.iter_rows(values_only=True), 1)
+            ]
+        finally:
+            workbook.close()
+
+    colonne = []
+    for intestazione in intestazioni:
+        colonne.extend(colonna for colonna in intestazione if colonna not in colonne)
+    return colonne + ['__sheet_name']
+
+def file_content_hash(file_path, block_size=1 << 20):
+    """SHA-256 del contenuto del file, registrato nel lotto di import"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as handle:
+        for blocco in iter(lambda: handle.read(block_size), b''):
+            digest.update(blocco)
+    return digest.hexdigest()
+
+def prepare_import_file(file_path, spool_dir, season=None, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Legge e normalizza un intero file senza toccare il database (gira nei processi
+    di import_files). Ogni blocco normalizzato viene salvato in `spool_dir` appena pronto,
+    così in memoria c'è un solo blocco alla volta. Ritorna (conteggi del file, percorsi dei
+    blocchi in ordine); la mappatura resta None se il file non ha righe.
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+    nome_file = os.path.basename(file_path)
+    stats = {
+        'file': nome_file, 'mapping': None, 'chunks': 0, 'rows_read': 0,
+        'discarded_seasons': 0, 'invalid_dates': 0, 'content_hash': file_content_hash(file_path)
+    }
+    blocchi = []
+    for chunk, _ in iter_import_chunks(file_path, chunk_rows):
+        if stats['mapping'] is None:
+            stats['mapping'] = rileva_mappatura_colonne(read_import_columns(file_path))
+            if stats['mapping'] not in MAPPATURE_DISPONIBILI:
+                raise ValueError(f"Mappatura '{stats['mapping']}' non trovata!")
+        df_normalizzato, chunk_stats = normalize_import_chunk(chunk, nome_file, stats['mapping'], season)
+        del chunk
+        stats['chunks'] += 1
+        for chiave, valore in chunk_stats.items():
+            stats[chiave] += valore
+        percorso = os.path.join(spool_dir, f"{stats['chunks']:06d}.pkl")
+        df_normalizzato.to_pickle(percorso)
+        del df_normalizzato
+        blocchi.append(percorso)
+    return stats, blocchi
+
+# ============================================================================
+# SNAPSHOT - copia colonnare delle partite letta in memory-map (opzionale)
+# ============================================================================
+
+# Attivo con MATCH_SNAPSHOTS=true: dopo ogni modifica dei dati le colonne delle pagine vengono
+# salvate in file .npy e get_matches_data(columns=...) le legge in memory-map invece di SQLite.
+# Più processi Streamlit condividono così le stesse pagine attraverso la cache del sistema
+SNAPSHOTS_ENABLED = os.getenv("MATCH_SNAPSHOTS", "False").lower() == "true"
+
+# Colonne dello snapshot: nome in get_matches_data -> (colonna di matches, tipo numpy; 'U' = testo).
+# div_key e season_key non sono salvate: valgono per l'intero intervallo di righe (vedi index.json)
+_SNAPSHOT_COLUMNS = {
+    'id': ('id', 'int64'),
+    'match_day': ('match_day', 'int32'),
+    'home_team': ('home_team_id', 'int32'),
+    'away_team': ('away_team_id', 'int32'),
+    'ft_home_goals': ('ft_home_goals', 'int16'),
+    'ft_away_goals': ('ft_away_goals', 'int16'),
+    'ht_home_goals': ('ht_home_goals', 'int16'),
+    'ht_away_goals': ('ht_away_goals', 'int16'),
+    'date': ('date', 'U'),
+    'ft_result': ('ft_result', 'U'),
+    'ht_result': ('ht_result', 'U'),
+}
+
+# Stesso ordine di get_matches_data dentro ogni (campionato, stagione)
+_SNAPSHOT_SELECT_SQL = f"""
+    SELECT div_key, season_key, {', '.join(colonna for colonna, _ in _SNAPSHOT_COLUMNS.values())}
+    FROM matches
+    ORDER BY div_key, season_key, match_day DESC, id DESC
+"""
+
+def write_match_snapshot(conn, root):
+    """Scrive lo snapshot delle partite della versione corrente dei dati in root/v<versione>.
+
+    Un file .npy per colonna (più <colonna>.mask.npy per i valori mancanti), con le righe
+    raggruppate per (campionato, stagione) e ordinate come in get_matches_data; index.json
+    riporta l'intervallo di righe di ogni gruppo. La cartella viene scritta con un nome
+    temporaneo e poi rinominata: chi legge vede solo snapshot completi.
+    Ritorna la cartella dello snapshot.
+    """
+    root = Path(root)
+    # Versione e partite lette nella stessa transazione: un import concorrente non può
+    # finire in uno snapshot etichettato con la versione precedente
+    conn.execute('BEGIN')
+    try:
+        data_version = conn.execute("SELECT value FROM app_metrics WHERE key = 'data_version'").fetchone()[0]
+        destinazione = root / f'v{data_version}'
+        if destinazione.exists():
+            return destinazione
+        df = pd.read_sql_query(_SNAPSHOT_SELECT_SQL, conn)
+    finally:
+        conn.rollback()
+    root.mkdir(parents=True, exist_ok=True)
+
+    temporanea = Path(tempfile.mkdtemp(prefix=f'v{data_version}.', dir=root))
+    try:
+        maschere = []
+        for nome, (colonna, tipo) in _SNAPSHOT_COLUMNS.items():
+            if tipo == 'U':
+                mancanti = df[colonna].isna().to_numpy()
+                valori = df[colonna].fillna('').astype(str).to_numpy(dtype=str)
+            else:
+                numeri = pd.to_numeric(df[colonna], errors='coerce')
+                mancanti = numeri.isna().to_numpy()
+                valori = numeri.fillna(0).to_numpy().astype(tipo)
+            np.save(temporanea / f'{nome}.npy', valori)
+            if mancanti.any():
+                np.save(temporanea / f'{nome}.mask.npy', mancanti)
+                maschere.append(nome)
+
+        # Le righe arrivano già raggruppate dall'ORDER BY: basta la dimensione di ogni gruppo
+        gruppi = df.groupby(['div_key', 'season_key'], sort=False, dropna=False).size()
+        fine = np.cumsum(gruppi.to_numpy())
+        intervalli = [
+            [None if pd.isna(div) else div, None if pd.isna(season) else season, int(stop - n), int(stop)]
+            for (div, season), n, stop in zip(gruppi.index, gruppi.to_numpy(), fine)
+        ]
+        with open(temporanea / 'index.json', 'w', encoding='utf-8') as handle:
+            json.dump({'data_version': data_version, 'rows': len(df), 'masks': maschere, 'slices': intervalli}, handle)
+
+        try:
+            os.rename(temporanea, destinazione)
+        except OSError:
+            # Un altro processo ha già scritto la stessa versione
+            shutil.rmtree(temporanea, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(temporanea, ignore_errors=True)
+        raise
+
+    # Le versioni precedenti non servono più (su Linux chi le ha aperte continua a leggerle)
+    for vecchia in root.iterdir():
+        if re.fullmatch(r'v\d+', vecchia.name) and int(vecchia.name[1:]) < data_version:
+            shutil.rmtree(vecchia, ignore_errors=True)
+    logger.info(f"Snapshot partite scritto: {len(df)} righe, {len(intervalli)} gruppi (versione {data_version})")
+    return destinazione
+
+class MatchSnapshot:
+    """Snapshot delle partite scritto da write_match_snapshot, aperto in sola lettura.
+    I file .npy sono mappati in memoria alla prima lettura della colonna e poi riusati.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        with open(self.directory / 'index.json', encoding='utf-8') as handle:
+            index = json.load(handle)
+        self.data_version = index['data_version']
+        self.masks = set(index['masks'])
+        self.slices = index['slices']
+        self._arrays = {}
+
+    def _array(self, nome):
+        array = self._arrays.get(nome)
+        if array is None:
+            array = self._arrays[nome] = np.load(self.directory / f'{nome}.npy', mmap_mode='r')
+        return array
+
+    def read(self, seasons=None, divisions=None, columns=MATCH_RESULT_COLUMNS, teams=None):
+        """Partite di `seasons`/`divisions` (già normalizzate come le colonne chiave) nello
+        stesso ordine di get_matches_data; None se nessun (campionato, stagione) corrisponde.
+        Con un solo gruppo le colonne numeriche sono viste sul file mappato.
+        `teams` è il dizionario delle squadre (id, nome) per decodificare home_team/away_team.
+        Ritorna un DataFrame da passare ad apply_match_dtypes.
+        """
+        stagioni = set(seasons) if seasons else None
+        campionati = set(divisions) if divisions else None
+        scelti = [
+            s for s in self.slices
+            if (stagioni is None or s[1] in stagioni) and (campionati is None or s[0] in campionati)
+        ]
+        if not scelti:
+            return None
+
+        lunghezze = [stop - start for _, _, start, stop in scelti]
+        if len(scelti) == 1:
+            righe = slice(scelti[0][2], scelti[0][3])
+            gruppi = np.zeros(lunghezze[0], dtype=np.int64)
+        else:
+            # Più gruppi: riordina per giorno (dal più recente, mancanti in fondo) e id decrescente
+            righe = np.concatenate([np.arange(start, stop) for _, _, start, stop in scelti])
+            gruppi = np.repeat(np.arange(len(scelti)), lunghezze)
+            giorni = self._array('match_day')[righe].astype(float)
+            if 'match_day' in self.masks:
+                giorni[self._array('match_day.mask')[righe]] = np.nan
+            ordine = np.lexsort((-self._array('id')[righe], np.where(np.isnan(giorni), np.inf, -giorni)))
+            righe, gruppi = righe[ordine], gruppi[ordine]
+
+        dati = {}
+        for nome in columns:
+            if nome in ('div_key', 'season_key'):
+                # Un solo valore per gruppo: categorie dai gruppi scelti, codici per riga
+                posizione = 0 if nome == 'div_key' else 1
+                etichette = sorted({s[posizione] for s in scelti if s[posizione] is not None})
+                codici = np.array([etichette.index(s[posizione]) if s[posizione] is not None else -1 for s in scelti])
+                dati[nome] = pd.Categorical.from_codes(codici[gruppi], categories=etichette)
+                continue
+
+            valori = self._array(nome)[righe]
+            mancanti = self._array(f'{nome}.mask')[righe] if nome in self.masks else None
+            if nome in ('home_team', 'away_team'):
+                ids = valori.astype(float)
+                if mancanti is not None:
+                    ids[mancanti] = np.nan
+                dati[nome] = _decode_dimension(pd.Series(ids), teams)
+            elif _SNAPSHOT_COLUMNS[nome][1] == 'U':
+                testo = valori.astype(object)
+                if mancanti is not None:
+                    testo[mancanti] = None
+                dati[nome] = testo
+            elif mancanti is None and nome == 'id':
+                dati[nome] = np.asarray(valori)
+            else:
+                dati[nome] = pd.arrays.IntegerArray(
+                    np.asarray(valori),
+                    np.asarray(mancanti) if mancanti is not None else np.zeros(len(valori), dtype=bool)
+                )
+        return pd.DataFrame(dati, columns=list(columns))
+
+# ============================================================================
+# CONNESSIONI - una connessione persistente per thread
+# ============================================================================
+
+# PRAGMA applicati ad ogni nuova connessione: WAL per non bloccare i lettori durante un import,
+# cache pagine da 64 MB (valore negativo = KiB) e file mappato in memoria fino a 256 MB
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=30000",
+)
+
+# Statement preparati tenuti in cache da ogni connessione
+CACHED_STATEMENTS = 256
+
+class ReusableConnection(sqlite3.Connection):
+    """Connessione condivisa dal thread: close() annulla l'eventuale transazione aperta ma non chiude.
+    I metodi esistenti possono continuare a chiamare conn.close() dopo commit.
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def close_for_real(self):
+        super().close()
+
 class FootballDatabase:
-    def __init__(self, environment="test"):
+    def __init__(self, environment="test", snapshots=None):
         """
         Inizializza il database per l'ambiente specificato
         
         Args:
             environment: "test" o "web" per separare i database
+            snapshots: usa lo snapshot colonnare delle partite (default: SNAPSHOTS_ENABLED)
         """
         self.environment = environment
         self.db_path = f"football_stats_{environment}.db"
+        self._local = threading.local()
+        # Stagioni, campionati e dizionari letti una volta per versione dei dati (vedi _per_versione)
+        self._cache_versione = {}
+        # Serializza le scritture degli import tra i thread (vedi _write_import_chunk)
+        self._lock_scrittura = threading.Lock()
+        self.snapshots = SNAPSHOTS_ENABLED if snapshots is None else snapshots
+        self.snapshot_root = Path(f"football_stats_{environment}_snapshot")
+        # Snapshot aperto (MatchSnapshot) e versione per cui get_matches_data l'ha già riscritto
+        self._snapshot = None
+        self._snapshot_tentato = None
         self.init_database()
+        self.normalize_season_values()
     
     def init_database(self):
         """Inizializza il database con le tabelle necessarie"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         # Tabella principale per i dati delle partite (struttura avanzata)
@@ -201,9 +1071,113 @@ class FootballDatabase:
                 home_red INTEGER,
                 away_red INTEGER,
                 file_source TEXT,
-                import_date TEXT DEFAULT CURRENT_TIMESTAMP
+                import_date TEXT DEFAULT CURRENT_TIMESTAMP,
+                season_key TEXT,
+                season_start INTEGER,
+                div_key TEXT,
+                match_date TEXT,
+                match_day INTEGER,
+                match_key TEXT,
+                home_team_id INTEGER,
+                away_team_id INTEGER,
+                div_id INTEGER,
+                batch_id INTEGER
+            )
+        ''')
+
+        # Lotti di import: un lotto per ogni import di un file, le partite ne salvano l'id
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS import_batches (
+                id INTEGER PRIMARY KEY,
+                file_name TEXT NOT NULL,
+                content_hash TEXT,
+                rows_read INTEGER NOT NULL DEFAULT 0,
+                inserted INTEGER NOT NULL DEFAULT 0,
+                duplicates INTEGER NOT NULL DEFAULT 0,
+                discarded INTEGER NOT NULL DEFAULT 0,
+                matches INTEGER NOT NULL DEFAULT 0,
+                first_season TEXT,
+                last_season TEXT,
+                started_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                finished_at TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_import_batches_file_name
+            ON import_batches(file_name)
+        ''')
+
+        # Dizionari di squadre e campionati (id interi usati nelle partite)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS teams (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS divisions (
+                id INTEGER PRIMARY KEY,
+                code TEXT NOT NULL UNIQUE
             )
         ''')
+
+        # Migrazione: aggiunge e popola le colonne chiave sui database esistenti
+        colonne_matches = {r[1] for r in cursor.execute('PRAGMA table_info(matches)')}
+        chiavi_mancanti = [
+            (nome, tipo) for nome, tipo in (('season_key', 'TEXT'), ('season_start', 'INTEGER'), ('div_key', 'TEXT'))
+            if nome not in colonne_matches
+        ]
+        for nome, tipo in chiavi_mancanti:
+            cursor.execute(f'ALTER TABLE matches ADD COLUMN {nome} {tipo}')
+        if chiavi_mancanti:
+            cursor.execute(MATCH_KEYS_UPDATE_SQL, (0,))
+            logger.info(f"Colonne chiave di matches popolate su {cursor.rowcount} righe")
+
+        # Migrazione: data ISO e numero del giorno interpretati dal testo già salvato
+        date_mancanti = [
+            (nome, tipo) for nome, tipo in (('match_date', 'TEXT'), ('match_day', 'INTEGER'))
+            if nome not in colonne_matches
+        ]
+        for nome, tipo in date_mancanti:
+            cursor.execute(f'ALTER TABLE matches ADD COLUMN {nome} {tipo}')
+        if date_mancanti:
+            righe = pd.read_sql_query('SELECT id, date FROM matches', conn)
+            date_parsed = parse_match_dates(righe['date'])
+            giorni = match_day_numbers(date_parsed)
+            aggiornamenti = [
+                (d.strftime('%Y-%m-%d'), int(g), int(i)) if not pd.isna(d) else (None, None, int(i))
+                for d, g, i in zip(date_parsed, giorni, righe['id'])
+            ]
+            cursor.executemany('UPDATE matches SET match_date = ?, match_day = ? WHERE id = ?', aggiornamenti)
+            logger.info(f"Date ISO popolate su {int(date_parsed.notna().sum())}/{len(righe)} partite")
+
+        # Migrazione: chiave di deduplica. I doppioni già presenti restano senza chiave
+        # (NULL è ammesso più volte dall'indice UNIQUE), conta la partita con l'id più basso
+        if 'match_key' not in colonne_matches:
+            cursor.execute('ALTER TABLE matches ADD COLUMN match_key TEXT')
+            cursor.execute(f'UPDATE matches SET match_key = {MATCH_KEY_SQL}')
+            cursor.execute('''
+                UPDATE matches SET match_key = NULL
+                WHERE match_key IS NOT NULL
+                  AND id NOT IN (SELECT MIN(id) FROM matches WHERE match_key IS NOT NULL GROUP BY match_key)
+            ''')
+            if cursor.rowcount:
+                logger.warning(f"Partite doppie già presenti lasciate senza match_key: {cursor.rowcount}")
+
+        # Migrazione: id di squadre e campionati (dopo le colonne chiave, serve div_key)
+        id_mancanti = [nome for nome in ('home_team_id', 'away_team_id', 'div_id') if nome not in colonne_matches]
+        for nome in id_mancanti:
+            cursor.execute(f'ALTER TABLE matches ADD COLUMN {nome} INTEGER')
+        if id_mancanti:
+            _update_match_dimensions(cursor, 0)
+            logger.info(f"Id di squadre e campionati popolati su {cursor.rowcount} partite")
+
+        # Migrazione: lotti di import dai file già presenti (dopo le colonne chiave, serve season_key)
+        if 'batch_id' not in colonne_matches:
+            cursor.execute('ALTER TABLE matches ADD COLUMN batch_id INTEGER')
+            for sql in IMPORT_BATCHES_MIGRATION_SQL:
+                cursor.execute(sql)
+            logger.info(f"Lotti di import creati per {cursor.rowcount} partite")
         
         # Tabella per tracciare le mappature usate
         cursor.execute('''
@@ -281,226 +1255,346 @@ class FootballDatabase:
             ON chat_messages(session_id)
         ''')
         
+        # Indici su matches per i filtri più frequenti (campionato/stagione, file, squadre).
+        # Filtri sulle colonne chiave e ordinamenti sul numero del giorno (la data testuale
+        # non è cronologica): gli indici delle versioni precedenti non servono più
+        for indice in ('idx_matches_div_season_date', 'idx_matches_season', 'idx_matches_div_key_season_key_date',
+                       'idx_matches_home_away_date', 'idx_matches_away_date'):
+            cursor.execute(f'DROP INDEX IF EXISTS {indice}')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_matches_div_key_season_key_day
+            ON matches(div_key, season_key, match_day)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_matches_season_key
+            ON matches(season_key, season_start)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_matches_file_source
+            ON matches(file_source)
+        ''')
+        # Eliminazione di un file: partite del lotto di import
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_matches_batch_id
+            ON matches(batch_id)
+        ''')
+        # Deduplica all'import: una sola partita per match_key
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_matches_match_key
+            ON matches(match_key)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_matches_home_away_day
+            ON matches(home_team, away_team, match_day)
+        ''')
+        # Con (home_team, ...) serve anche per le OR casa/trasferta dei filtri per squadra
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_matches_away_day
+            ON matches(away_team, match_day)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_matches_match_day
+            ON matches(match_day)
+        ''')
+
+        # Vista materializzata per squadra: due righe per partita (casa e trasferta)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS team_matches (
+                match_id INTEGER NOT NULL,
+                div TEXT,
+                season TEXT,
+                date TEXT,
+                team TEXT,
+                opponent TEXT,
+                venue TEXT,
+                ft_gf INTEGER,
+                ft_ga INTEGER,
+                ht_gf INTEGER,
+                ht_ga INTEGER,
+                sh_gf INTEGER,
+                sh_ga INTEGER,
+                outcome TEXT,
+                points INTEGER
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_team_matches_div_season_team_date
+            ON team_matches(div, season, team, date)
+        ''')
+        # Una sola riga per (partita, casa/fuori): una partita derivata due volte fa fallire
+        # l'import invece di raddoppiare le classifiche. I doppioni lasciati da import
+        # concorrenti vengono rimossi e le tabelle aggregate ricostruite più sotto
+        doppioni_team_matches = 0
+        cursor.execute(
+            "SELECT EXISTS(SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_team_matches_match_venue')"
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute('''
+                DELETE FROM team_matches
+                WHERE rowid NOT IN (SELECT MIN(rowid) FROM team_matches GROUP BY match_id, venue)
+            ''')
+            doppioni_team_matches = cursor.rowcount
+            if doppioni_team_matches:
+                logger.warning(f"Righe doppie rimosse da team_matches: {doppioni_team_matches}")
+        cursor.execute('DROP INDEX IF EXISTS idx_team_matches_match_id')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_team_matches_match_venue
+            ON team_matches(match_id, venue)
+        ''')
+        
+        # Migrazione: popola team_matches per i database esistenti
+        cursor.execute('SELECT EXISTS(SELECT 1 FROM team_matches)')
+        if not cursor.fetchone()[0]:
+            cursor.execute(TEAM_MATCHES_INSERT_SQL, (0, 0))
+            if cursor.rowcount:
+                logger.info(f"team_matches popolata con {cursor.rowcount} righe")
+
+        # Classifiche aggregate per (campionato, stagione, squadra, casa/fuori, tempo)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS standings_agg (
+                div TEXT NOT NULL,
+                season TEXT NOT NULL,
+                team TEXT NOT NULL,
+                venue TEXT NOT NULL,
+                half TEXT NOT NULL,
+                pg INTEGER NOT NULL DEFAULT 0,
+                v INTEGER NOT NULL DEFAULT 0,
+                n INTEGER NOT NULL DEFAULT 0,
+                p INTEGER NOT NULL DEFAULT 0,
+                gf INTEGER NOT NULL DEFAULT 0,
+                gs INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (div, season, team, venue, half)
+            )
+        ''')
+
+        # Migrazione colonne chiave/date: team_matches passa alle chiavi canoniche e alla data ISO;
+        # con le nuove chiavi standings_agg viene ricostruita qui sotto
+        if chiavi_mancanti or date_mancanti:
+            cursor.execute('''
+                UPDATE team_matches
+                SET div = (SELECT div_key FROM matches WHERE matches.id = team_matches.match_id),
+                    season = (SELECT season_key FROM matches WHERE matches.id = team_matches.match_id),
+                    date = (SELECT match_date FROM matches WHERE matches.id = team_matches.match_id)
+            ''')
+        cursor.execute("SELECT value FROM app_metrics WHERE key = 'standings_agg_version'")
+        riga = cursor.fetchone()
+        agg_obsoleta = riga is None or riga[0] < STANDINGS_AGG_VERSION
+        if chiavi_mancanti or doppioni_team_matches or agg_obsoleta:
+            cursor.execute('DELETE FROM standings_agg')
+            if cursor.rowcount:
+                cursor.execute(DATA_VERSION_BUMP_SQL)
+
+        # Migrazione: popola standings_agg per i database esistenti
+        cursor.execute('SELECT EXISTS(SELECT 1 FROM standings_agg)')
+        if not cursor.fetchone()[0]:
+            cursor.execute(STANDINGS_AGG_UPSERT_SQL, (0, 0, 0))
+            if cursor.rowcount:
+                logger.info(f"standings_agg popolata con {cursor.rowcount} righe")
+        if agg_obsoleta:
+            cursor.execute('''
+                INSERT INTO app_metrics(key, value) VALUES('standings_agg_version', ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            ''', (STANDINGS_AGG_VERSION,))
+
+        # Riepilogo per Dashboard e Gestione File: partite e date per (stagione, campionato, file)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS dataset_summary (
+                season TEXT NOT NULL,
+                div TEXT NOT NULL,
+                file_source TEXT NOT NULL,
+                matches INTEGER NOT NULL DEFAULT 0,
+                first_date TEXT,
+                last_date TEXT,
+                PRIMARY KEY (season, div, file_source)
+            )
+        ''')
+        if chiavi_mancanti or doppioni_team_matches:
+            cursor.execute('DELETE FROM dataset_summary')
+
+        # Migrazione: popola dataset_summary per i database esistenti
+        cursor.execute('SELECT EXISTS(SELECT 1 FROM dataset_summary)')
+        if not cursor.fetchone()[0]:
+            cursor.execute(DATASET_SUMMARY_UPSERT_SQL, (0,))
+            if cursor.rowcount:
+                logger.info(f"dataset_summary popolata con {cursor.rowcount} righe")
+
         conn.commit()
         conn.close()
         logger.info("Database avanzato inizializzato correttamente")
     
     def get_connection(self):
-        """Ottiene una connessione al database"""
-        return sqlite3.connect(self.db_path)
+        """Ottiene la connessione del thread corrente (creata alla prima richiesta e poi riutilizzata)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=30,
+                factory=ReusableConnection,
+                cached_statements=CACHED_STATEMENTS
+            )
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            # Normalizzazione stagioni in SQL (import, migrazione, manutenzione)
+            conn.create_function('normalize_season', 1, _season_key, deterministic=True)
+            conn.create_function('season_start_year', 1, _season_start, deterministic=True)
+            self._local.conn = conn
+        elif conn.in_transaction:
+            # Transazione lasciata aperta da un'operazione fallita: non va confermata da altri
+            conn.rollback()
+        return conn
+
+    def close_connection(self):
+        """Chiude davvero la connessione del thread corrente (script, test, arresto)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close_for_real()
+            self._local.conn = None
     
     def rileva_mappatura(self, df):
         """Analizza le colonne del file e prova a rilevare quale mappatura usare"""
-        colonne_file = set(df.columns)
-        
-        migliore_match = None
-        max_corrispondenze = 0
-        
-        for nome_mappatura, mappatura in MAPPATURE_DISPONIBILI.items():
-            colonne_mappatura = set(mappatura.keys())
-            corrispondenze = len(colonne_file.intersection(colonne_mappatura))
-            
-            if corrispondenze > max_corrispondenze:
-                max_corrispondenze = corrispondenze
-                migliore_match = nome_mappatura
-        
-        percentuale = (max_corrispondenze / len(colonne_file)) * 100 if len(colonne_file) > 0 else 0
-        
-        logger.info(f"Mappatura rilevata: {migliore_match} ({max_corrispondenze}/{len(colonne_file)} colonne - {percentuale:.1f}%)")
-        
-        return migliore_match
-    
-    def import_excel_file(self, file_path, season=None, file_type="main"):
-        """Importa un file Excel nel database con sistema avanzato"""
+        return rileva_mappatura_colonne(df.columns)
+
+    def _write_import_chunk(self, conn, df_normalizzato, batch_id=None):
+        """Scrive un blocco normalizzato in una sola transazione: partite nuove (le doppie sono
+        scartate dall'indice UNIQUE su match_key) con l'id del lotto di import, colonne chiave,
+        team_matches, standings_agg e dataset_summary.
+        Ritorna il numero di partite inserite.
+        """
+        # Un import alla volta per istanza: le connessioni per thread altrimenti si
+        # contenderebbero il lock di SQLite fino al timeout
+        with self._lock_scrittura:
+            cursor = conn.cursor()
+            try:
+                # Lock di scrittura preso prima di leggere MAX(id): un altro writer non può inserire
+                # partite tra la lettura e l'INSERT, che verrebbero poi derivate una seconda volta
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('SELECT COALESCE(MAX(id), 0) FROM matches')
+                ultimo_id = cursor.fetchone()[0]
+
+                partite_inserite = _insert_new_matches(cursor, df_normalizzato.assign(batch_id=batch_id))
+
+                # Aggiorna le tabelle derivate solo se ci sono partite nuove
+                if partite_inserite > 0:
+                    # Colonne chiave (stagione canonica, campionato senza spazi) delle nuove partite
+                    cursor.execute(MATCH_KEYS_UPDATE_SQL, (ultimo_id,))
+                    # ...e id di squadre e campionati dai dizionari
+                    _update_match_dimensions(cursor, ultimo_id)
+                    # Aggiorna la vista per squadra solo con le partite appena inserite
+                    cursor.execute(TEAM_MATCHES_INSERT_SQL, (ultimo_id, ultimo_id))
+                    # ...e le classifiche aggregate con i soli contatori delle nuove partite
+                    cursor.execute(STANDINGS_AGG_UPSERT_SQL, (ultimo_id, ultimo_id, ultimo_id))
+                    # ...e il riepilogo per stagione/campionato/file
+                    cursor.execute(DATASET_SUMMARY_UPSERT_SQL, (ultimo_id,))
+                    cursor.execute(DATA_VERSION_BUMP_SQL)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return partite_inserite
+
+    def _start_import_batch(self, conn, nome_file, content_hash):
+        """Registra un nuovo lotto di import in import_batches e ne ritorna l'id"""
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT id FROM import_batches WHERE content_hash = ? ORDER BY id DESC LIMIT 1', (content_hash,)
+        )
+        precedente = cursor.fetchone()
+        if precedente:
+            logger.info(f"Contenuto di {nome_file} già importato (lotto {precedente[0]}): le partite saranno doppie")
+        cursor.execute(
+            'INSERT INTO import_batches (file_name, content_hash, started_at) VALUES (?, ?, CURRENT_TIMESTAMP)',
+            (nome_file, content_hash)
+        )
+        conn.commit()
+        return cursor.lastrowid
+
+    def _finish_import_batch(self, conn, batch_id, stats):
+        """Chiude il lotto con i conteggi dell'import e le partite/stagioni effettivamente salvate"""
+        conn.execute(IMPORT_BATCH_FINISH_SQL, (
+            stats.get('rows_read', 0), stats.get('inserted', 0), stats.get('duplicates', 0),
+            stats.get('discarded_seasons', 0), batch_id
+        ))
+        conn.commit()
+
+    def _save_column_mapping(self, conn, nome_file, nome_mappatura):
+        """Registra in mappature_colonne la mappatura usata per un file importato"""
+        mappatura = MAPPATURE_DISPONIBILI[nome_mappatura]
+        cursor = conn.cursor()
+        for colonna_orig, colonna_dest in mappatura.items():
+            cursor.execute('''
+                INSERT INTO mappature_colonne (file_origine, colonna_originale, colonna_destinazione, note)
+                VALUES (?, ?, ?, ?)
+            ''', (nome_file, colonna_orig, colonna_dest, f"Mappatura: {nome_mappatura}"))
+        conn.commit()
+
+    def import_excel_file(self, file_path, season=None, file_type="main",
+                          chunk_rows=IMPORT_CHUNK_ROWS, progress_callback=None):
+        """Importa un file Excel/CSV nel database a blocchi di `chunk_rows` righe.
+
+        Ogni blocco passa per mappatura, normalizzazione stagioni, filtro stagioni vecchie,
+        deduplica e inserimento in una propria transazione: la memoria usata dipende dalla
+        dimensione del blocco e non da quella del file. `progress_callback(stats)` viene
+        chiamata dopo ogni blocco con i conteggi parziali e 'progress' (0-1).
+
+        Le partite salvate portano l'id del lotto di import (tabella import_batches), chiuso
+        alla fine con conteggi e stagioni anche se l'import si interrompe.
+
+        Ritorna il dizionario dei conteggi (file, mapping, batch_id, chunks, rows_read,
+        discarded_seasons, invalid_dates, inserted, duplicates, seconds) oppure False se
+        l'import fallisce.
+        """
+        nome_file = os.path.basename(file_path)
+        stats = {
+            'file': nome_file, 'mapping': None, 'batch_id': None, 'chunks': 0, 'rows_read': 0,
+            'discarded_seasons': 0, 'invalid_dates': 0, 'inserted': 0, 'duplicates': 0,
+            'seconds': 0.0, 'progress': 0.0
+        }
+        inizio = time.perf_counter()
         try:
-            logger.info(f"Importazione file: {os.path.basename(file_path)}")
-            
-            # Leggi il file
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-                logger.info(f"File CSV caricato: {len(df)} righe")
-            else:
-                # Leggi TUTTI i fogli del file Excel
-                excel_file = pd.ExcelFile(file_path)
-                logger.info(f"File Excel caricato - Fogli: {len(excel_file.sheet_names)}")
-                
-                # Leggi e concatena tutti i fogli
-                all_sheets = []
-                for sheet_name in excel_file.sheet_names:
-                    df_sheet = pd.read_excel(file_path, sheet_name=sheet_name)
-                    # Tieni traccia del foglio per eventuale fallback del campionato
-                    df_sheet['__sheet_name'] = str(sheet_name)
-                    logger.info(f"Foglio {sheet_name}: {len(df_sheet)} righe")
-                    all_sheets.append(df_sheet)
-                
-                # Concatena tutti i fogli in un unico DataFrame
-                df = pd.concat(all_sheets, ignore_index=True)
-                logger.info(f"Totale righe da tutti i fogli: {len(df)}")
-            
-            # Rileva mappatura automaticamente
-            mappatura_nome = self.rileva_mappatura(df)
-            mappatura = MAPPATURE_DISPONIBILI.get(mappatura_nome)
-            
-            if not mappatura:
-                logger.error(f"Mappatura '{mappatura_nome}' non trovata!")
-                return False
-            
-            # Crea DataFrame normalizzato
-            df_normalizzato = pd.DataFrame()
-            
-            # Applica mappatura
-            for colonna_orig, colonna_dest in mappatura.items():
-                if colonna_orig in df.columns:
-                    df_normalizzato[colonna_dest] = df[colonna_orig]
-                else:
-                    df_normalizzato[colonna_dest] = None
-
-            # Normalizza il nome campionato e fallback al nome foglio se mancante
-            if 'div' in df_normalizzato.columns:
-                df_normalizzato['div'] = df_normalizzato['div'].astype(str).str.strip()
-                if '__sheet_name' in df.columns:
-                    mask_missing_div = df_normalizzato['div'].isna() | (df_normalizzato['div'] == '') | (df_normalizzato['div'].str.lower() == 'none')
-                    df_normalizzato.loc[mask_missing_div, 'div'] = df.loc[mask_missing_div, '__sheet_name'].astype(str).str.strip()
-            
-            # GESTIONE STAGIONE
-            # Regola richiesta: per i file standard "all-euro-data-YYYY-YYYY" usare SEMPRE la stagione dal nome file
-            nome_file = os.path.basename(file_path)
-            if mappatura_nome == 'standard':
-                match = re.search(r'(\d{4})-(\d{4})', nome_file)
-                if match:
-                    stagione_estratta = f"{match.group(1)}-{match.group(2)}"
-                    df_normalizzato['season'] = stagione_estratta
-                    logger.info(f"[standard] Stagione forzata dal nome file: {stagione_estratta}")
-                else:
-                    # fallback: come prima
-                    stagione_mancante = ('season' not in df_normalizzato.columns) or (df_normalizzato['season'].isna().all())
-                    if stagione_mancante:
-                        if season:
-                            df_normalizzato['season'] = season
-                            logger.info(f"Stagione impostata manualmente: {season}")
-                        else:
-                            df_normalizzato['season'] = None
-                            logger.warning("Impossibile determinare la stagione (standard, no match nel nome file)")
-            else:
-                # Comportamento precedente: se manca, prova da parametro o nome file
-                stagione_mancante = ('season' not in df_normalizzato.columns) or (df_normalizzato['season'].isna().all())
-                if stagione_mancante:
-                    if season:
-                        df_normalizzato['season'] = season
-                        logger.info(f"Stagione impostata manualmente: {season}")
-                    else:
-                        match = re.search(r'(\d{4})-(\d{4})', nome_file)
-                        if match:
-                            stagione_estratta = f"{match.group(1)}-{match.group(2)}"
-                            df_normalizzato['season'] = stagione_estratta
-                            logger.info(f"Stagione estratta dal nome file: {stagione_estratta}")
-                        else:
-                            df_normalizzato['season'] = None
-                            logger.warning("Impossibile determinare la stagione!")
-            
-            # Aggiungi metadata
-            df_normalizzato['file_source'] = os.path.basename(file_path)
-            
-            # Rimuovi righe vuote
-            df_normalizzato = df_normalizzato.dropna(subset=['home_team', 'away_team'])
-            
-            # CONVERSIONE STAGIONE: normalizza separatori e, se anno singolo (es: 2021) → 2021-2022
-            if 'season' in df_normalizzato.columns:
-                def converti_stagione(stagione_str):
-                    if pd.isna(stagione_str) or stagione_str == 'None':
-                        return None
-                    
-                    stagione_str = str(stagione_str).strip()
-                    # Normalizza separatori: punto o slash → trattino
-                    stagione_str = stagione_str.replace('/', '-').replace('.', '-')
-                    
-                    # Se contiene già il trattino, è già in formato corretto
-                    if '-' in stagione_str:
-                        return stagione_str
-                    
-                    # Se è un anno singolo (4 cifre), convertilo
-                    if stagione_str.isdigit() and len(stagione_str) == 4:
-                        anno = int(stagione_str)
-                        return f"{anno}-{anno + 1}"
-                    
-                    return stagione_str
-                
-                df_normalizzato['season'] = df_normalizzato['season'].apply(converti_stagione)
-                logger.info("Stagioni convertite (es: 2021 → 2021-2022)")
-            
-            # FILTRO STAGIONI VECCHIE (scarta <= 2019-2020)
-            if 'season' in df_normalizzato.columns:
-                df_prima_filtro = len(df_normalizzato)
-                
-                # Filtra via le stagioni vecchie e quelle mancanti
-                df_normalizzato = df_normalizzato[
-                    (df_normalizzato['season'].notna()) &
-                    (df_normalizzato['season'] > '2019-2020')
-                ].copy()
-                
-                df_dopo_filtro = len(df_normalizzato)
-                stagioni_scartate = df_prima_filtro - df_dopo_filtro
-                
-                if stagioni_scartate > 0:
-                    logger.warning(f"{stagioni_scartate} partite scartate (stagioni <= 2019-2020 o mancanti)")
-                
-                logger.info(f"Partite valide dopo filtro: {df_dopo_filtro}")
-            
-            # Converti le date in stringhe
-            colonne_data = ['date', 'time', 'season']
-            for col in colonne_data:
-                if col in df_normalizzato.columns:
-                    df_normalizzato[col] = df_normalizzato[col].astype(str)
-            
-            # CONTROLLO DUPLICATI
+            logger.info(f"Importazione file: {nome_file}")
             conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            logger.info("Controllo duplicati...")
-            
-            # Carica tutte le partite esistenti in memoria
-            df_esistenti = pd.read_sql_query(
-                'SELECT home_team, away_team, date FROM matches',
-                conn
-            )
-            
-            logger.info(f"Partite già nel database: {len(df_esistenti)}")
-            logger.info(f"Partite da verificare: {len(df_normalizzato)}")
-            
-            if len(df_esistenti) > 0:
-                # Crea colonna chiave per confronto veloce
-                df_normalizzato['_chiave'] = (
-                    df_normalizzato['home_team'].astype(str) + '|' + 
-                    df_normalizzato['away_team'].astype(str) + '|' + 
-                    df_normalizzato['date'].astype(str)
-                )
-                df_esistenti['_chiave'] = (
-                    df_esistenti['home_team'].astype(str) + '|' + 
-                    df_esistenti['away_team'].astype(str) + '|' + 
-                    df_esistenti['date'].astype(str)
+
+            for chunk, avanzamento in iter_import_chunks(file_path, chunk_rows):
+                # Rileva mappatura automaticamente (una volta per file, dalle intestazioni di tutti i fogli)
+                if stats['mapping'] is None:
+                    stats['mapping'] = rileva_mappatura_colonne(read_import_columns(file_path))
+                    if stats['mapping'] not in MAPPATURE_DISPONIBILI:
+                        logger.error(f"Mappatura '{stats['mapping']}' non trovata!")
+                        return False
+                    stats['batch_id'] = self._start_import_batch(conn, nome_file, file_content_hash(file_path))
+
+                df_normalizzato, chunk_stats = normalize_import_chunk(chunk, nome_file, stats['mapping'], season)
+                del chunk
+                partite_inserite = self._write_import_chunk(conn, df_normalizzato, stats['batch_id'])
+
+                stats['chunks'] += 1
+                for chiave, valore in chunk_stats.items():
+                    stats[chiave] += valore
+                stats['inserted'] += partite_inserite
+                stats['duplicates'] += len(df_normalizzato) - partite_inserite
+                stats['progress'] = avanzamento
+                logger.info(
+                    f"Blocco {stats['chunks']}: {chunk_stats['rows_read']} righe lette, "
+                    f"{partite_inserite} importate, {len(df_normalizzato) - partite_inserite} duplicate"
                 )
-                
-                # Trova partite nuove
-                chiavi_esistenti = set(df_esistenti['_chiave'])
-                df_normalizzato['_is_new'] = ~df_normalizzato['_chiave'].isin(chiavi_esistenti)
-                
-                df_nuove = df_normalizzato[df_normalizzato['_is_new']].copy()
-                df_nuove = df_nuove.drop(columns=['_chiave', '_is_new'])
-                
-                partite_duplicate = len(df_normalizzato) - len(df_nuove)
-            else:
-                df_nuove = df_normalizzato.copy()
-                partite_duplicate = 0
-            
-            logger.info(f"Partite nuove da importare: {len(df_nuove)}")
-            logger.info(f"Partite duplicate (saltate): {partite_duplicate}")
-            
-            # Salva solo le partite nuove
-            if len(df_nuove) > 0:
-                df_nuove.to_sql('matches', conn, if_exists='append', index=False)
-                logger.info(f"{len(df_nuove)} partite importate nel database")
-                
-                success_message = f"File importato con successo! {len(df_nuove)} record aggiunti."
+                if progress_callback:
+                    progress_callback(dict(stats))
+
+            if stats['mapping'] is None:
+                logger.warning(f"Nessuna riga letta da {nome_file}")
+                return False
+
+            if stats['discarded_seasons'] > 0:
+                logger.warning(f"{stats['discarded_seasons']} partite scartate (stagioni <= 2019-2020 o mancanti)")
+            if stats['invalid_dates'] > 0:
+                logger.warning(f"Date non interpretabili: {stats['invalid_dates']} partite senza match_date")
+            logger.info(f"Partite nuove importate: {stats['inserted']}")
+            logger.info(f"Partite duplicate (saltate): {stats['duplicates']}")
+
+            if stats['inserted'] > 0:
+                success_message = f"File importato con successo! {stats['inserted']} record aggiunti."
+                if stats['duplicates']:
+                    success_message += f" {stats['duplicates']} partite duplicate saltate."
                 if STREAMLIT_AVAILABLE:
                     st.success(success_message)
                 else:
@@ -511,20 +1605,19 @@ class FootballDatabase:
                     st.warning("Nessuna partita nuova da importare (tutte duplicate)")
                 else:
                     print("Nessuna partita nuova da importare (tutte duplicate)")
-            
-            # Salva mappatura usata
-            for colonna_orig, colonna_dest in mappatura.items():
-                cursor.execute('''
-                    INSERT INTO mappature_colonne (file_origine, colonna_originale, colonna_destinazione, note)
-                    VALUES (?, ?, ?, ?)
-                ''', (os.path.basename(file_path), colonna_orig, colonna_dest, f"Mappatura: {mappatura_nome}"))
-            
-            conn.commit()
+
+            # Salva mappatura usata e chiude il lotto di import
+            self._save_column_mapping(conn, nome_file, stats['mapping'])
+            self._finish_import_batch(conn, stats['batch_id'], stats)
             conn.close()
-            
-            logger.info(f"Mappatura usata: {mappatura_nome}")
-            return True
-            
+
+            if stats['inserted'] > 0:
+                self.refresh_snapshot()
+
+            stats['seconds'] = round(time.perf_counter() - inizio, 3)
+            logger.info(f"Mappatura usata: {stats['mapping']}")
+            return stats
+
         except Exception as e:
             error_message = f"Errore durante l'import: {str(e)}"
             if STREAMLIT_AVAILABLE:
@@ -532,106 +1625,414 @@ class FootballDatabase:
             else:
                 print(error_message)
             logger.error(f"Errore import file {file_path}: {str(e)}")
+            # I blocchi già scritti restano: il lotto va chiuso con le partite salvate
+            if stats['batch_id'] is not None:
+                try:
+                    self._finish_import_batch(self.get_connection(), stats['batch_id'], stats)
+                except Exception as errore_lotto:
+                    logger.error(f"Lotto di import {stats['batch_id']} non chiuso: {str(errore_lotto)}")
             return False
-    
+
+    def import_files(self, file_paths, season=None, max_workers=None,
+                     chunk_rows=IMPORT_CHUNK_ROWS, progress_callback=None):
+        """Importa più file: lettura e normalizzazione in parallelo in un pool di processi,
+        scrittura in questo processo con un solo writer (SQLite ammette un writer alla volta).
+
+        I file vengono scritti nell'ordine ricevuto, quindi le partite doppie tra file diversi
+        restano a quello che viene prima, come importandoli uno alla volta. I processi salvano
+        ogni blocco normalizzato in una cartella temporanea e il writer li rilegge uno alla
+        volta: la memoria dipende da `max_workers` × `chunk_rows`, non dalla dimensione né dal
+        numero dei file. Un file che fallisce non ferma gli altri: il suo lotto viene chiuso con
+        le partite già salvate. `progress_callback(file_stats)` viene chiamata dopo ogni file scritto.
+
+        Ritorna {'files': conteggi per file (con 'error' se il file non è stato importato),
+        'rows_read', 'inserted', 'duplicates', 'seconds', 'rows_per_second'}.
+        """
+        file_paths = list(file_paths)
+        max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(file_paths) or 1))
+        riepilogo = {'files': [], 'rows_read': 0, 'inserted': 0, 'duplicates': 0,
+                     'seconds': 0.0, 'rows_per_second': 0.0}
+        inizio = time.perf_counter()
+        logger.info(f"Import multiplo: {len(file_paths)} file, {max_workers} processi")
+
+        conn = self.get_connection()
+        spool_root = tempfile.mkdtemp(prefix='import_')
+
+        def scrivi(file_path, future):
+            nome_file = os.path.basename(file_path)
+            stats = {'file': nome_file, 'batch_id': None, 'inserted': 0, 'duplicates': 0}
+            try:
+                stats_file, blocchi = future.result()
+                stats.update(stats_file)
+                if stats['mapping'] is not None:
+                    stats['batch_id'] = self._start_import_batch(conn, nome_file, stats['content_hash'])
+                for percorso in blocchi:
+                    df_normalizzato = pd.read_pickle(percorso)
+                    os.remove(percorso)
+                    partite_inserite = self._write_import_chunk(conn, df_normalizzato, stats['batch_id'])
+                    stats['inserted'] += partite_inserite
+                    stats['duplicates'] += len(df_normalizzato) - partite_inserite
+                    del df_normalizzato
+                if stats['mapping'] is None:
+                    stats['error'] = 'nessuna riga letta'
+                else:
+                    self._save_column_mapping(conn, nome_file, stats['mapping'])
+            except Exception as e:
+                logger.error(f"Errore import file {file_path}: {str(e)}")
+                conn.rollback()
+                # I blocchi già scritti restano: conteggi e lotto riportano le partite salvate
+                stats['error'] = str(e)
+            if stats['batch_id'] is not None:
+                try:
+                    self._finish_import_batch(conn, stats['batch_id'], stats)
+                except Exception as errore_lotto:
+                    conn.rollback()
+                    logger.error(f"Lotto di import {stats['batch_id']} non chiuso: {str(errore_lotto)}")
+            logger.info(
+                f"{nome_file}: {stats.get('rows_read', 0)} righe lette, {stats.get('inserted', 0)} importate, "
+                f"{stats.get('duplicates', 0)} duplicate, {stats.get('discarded_seasons', 0)} stagioni scartate"
+            )
+            riepilogo['files'].append(stats)
+            for chiave in ('rows_read', 'inserted', 'duplicates'):
+                riepilogo[chiave] += stats.get(chiave, 0)
+            if progress_callback:
+                progress_callback(dict(stats))
+
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                in_attesa = deque()
+                for indice, file_path in enumerate(file_paths):
+                    spool_dir = os.path.join(spool_root, str(indice))
+                    in_attesa.append((file_path, pool.submit(prepare_import_file, file_path, spool_dir, season, chunk_rows)))
+                    if len(in_attesa) > max_workers:
+                        scrivi(*in_attesa.popleft())
+                while in_attesa:
+                    scrivi(*in_attesa.popleft())
+        finally:
+            shutil.rmtree(spool_root, ignore_errors=True)
+
+        if riepilogo['inserted'] > 0:
+            self.refresh_snapshot()
+
+        riepilogo['seconds'] = round(time.perf_counter() - inizio, 3)
+        if riepilogo['seconds'] > 0:
+            riepilogo['rows_per_second'] = round(riepilogo['rows_read'] / riepilogo['seconds'], 1)
+        logger.info(
+            f"Import multiplo completato: {riepilogo['rows_read']} righe lette, {riepilogo['inserted']} importate "
+            f"in {riepilogo['seconds']}s ({riepilogo['rows_per_second']} righe/s)"
+        )
+        return riepilogo
+
+    def _per_versione(self, chiave, carica):
+        """Risultato di `carica()` tenuto in memoria finché non cambia la versione dei dati.
+        La versione è salvata nel database e incrementata da import, eliminazioni e
+        normalizzazioni: anche gli altri processi vedono le modifiche.
+        """
+        versione = self.get_data_version()
+        cached = self._cache_versione.get(chiave)
+        if cached is None or cached[0] != versione:
+            self._cache_versione[chiave] = cached = (versione, carica())
+        return cached[1]
+
     def get_available_seasons(self):
-        """Ottiene le stagioni disponibili nel database"""
+        """Ottiene le stagioni disponibili nel database (dalla più recente)"""
+        return list(self._per_versione('seasons', self._load_available_seasons))
+
+    def _load_available_seasons(self):
         conn = self.get_connection()
-        # Normalizza a livello di query i separatori e gli spazi
+        # Stagioni già canoniche: basta la scansione dell'indice su (season_key, season_start)
         query = '''
-            SELECT DISTINCT 
-                REPLACE(REPLACE(TRIM(season), '.', '-'), '/', '-') AS season
-            FROM matches 
-            WHERE season IS NOT NULL
+            SELECT season_key
+            FROM matches
+            WHERE season_key IS NOT NULL
+            GROUP BY season_key
+            ORDER BY MAX(season_start) DESC, season_key DESC
         '''
         seasons_df = pd.read_sql_query(query, conn)
         conn.close()
-
-        # Converte anni singoli 2021 -> 2021-2022 al volo
-        normalized = []
-        for s in seasons_df['season'].astype(str).tolist():
-            s = s.strip()
-            if s.isdigit() and len(s) == 4:
-                anno = int(s)
-                normalized.append(f"{anno}-{anno+1}")
-            else:
-                normalized.append(s)
-
-        # Ordina desc
-        return sorted(set(normalized), reverse=True)
+        return seasons_df['season_key'].tolist()
     
     def normalize_season_values(self):
-        """Normalizza i formati stagione in tutto il DB (es. 2022.2023 -> 2022-2023, '2022' -> 2022-2023)"""
+        """Normalizza i formati stagione in tutto il DB (es. 2022.2023 -> 2022-2023, '2022' -> 2022-2023).
+
+        Una sola UPDATE in una transazione riscrive le sole stagioni da cambiare, con la funzione
+        registrata normalize_season_counted che conta le regole applicate. Le colonne chiave
+        (season_key e derivate) non cambiano: sono già calcolate con la stessa normalizzazione.
+        Leggera se non c'è niente da fare, viene eseguita all'avvio.
+
+        Ritorna i conteggi per regola (SEASON_NORMALIZATION_RULES) e 'rows', le partite aggiornate.
+        """
+        conteggi = dict.fromkeys(SEASON_NORMALIZATION_RULES, 0)
+
+        def normalizza(season):
+            if season is None:
+                return None
+            stagione, regole = _season_rules(season)
+            for regola in regole:
+                conteggi[regola] += 1
+            return stagione
+
         conn = self.get_connection()
+        conn.create_function('normalize_season_counted', 1, normalizza)
         cursor = conn.cursor()
-        # 1) Trim spazi
-        cursor.execute("UPDATE matches SET season = TRIM(season) WHERE season IS NOT NULL")
-        # 2) Sostituisci punto e slash con trattino
-        cursor.execute("UPDATE matches SET season = REPLACE(season, '.', '-') WHERE season LIKE '%.%' ")
-        cursor.execute("UPDATE matches SET season = REPLACE(season, '/', '-') WHERE season LIKE '%/%' ")
-        # 3) Converti anni singoli in range anno-anno+1
-        rows = pd.read_sql_query("SELECT id, season FROM matches WHERE season IS NOT NULL", conn)
-        updates = []
-        for _, r in rows.iterrows():
-            s = str(r['season'])
-            if s.isdigit() and len(s) == 4:
-                anno = int(s)
-                updates.append((f"{anno}-{anno+1}", r['id']))
-        if updates:
-            cursor.executemany("UPDATE matches SET season = ? WHERE id = ?", updates)
-        conn.commit()
+        try:
+            cursor.execute(SEASON_NORMALIZE_SQL)
+            conteggi['rows'] = cursor.rowcount
+            if conteggi['rows']:
+                cursor.execute(DATA_VERSION_BUMP_SQL)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.create_function('normalize_season_counted', 1, None)
         conn.close()
-        return len(updates)
+
+        if conteggi['rows']:
+            logger.info(f"Stagioni normalizzate: {conteggi}")
+            self.refresh_snapshot()
+        return conteggi
     
     def get_available_divisions(self):
-        """Ottiene le divisioni disponibili nel database"""
+        """Ottiene le divisioni disponibili nel database (per nome visualizzato, senza blacklist)"""
+        return list(self._per_versione('divisions', self._load_available_divisions))
+
+    def _load_available_divisions(self):
         conn = self.get_connection()
         query = '''
-            SELECT DISTINCT TRIM(div) AS div FROM matches 
-            WHERE div IS NOT NULL AND TRIM(div) <> ''
+            SELECT DISTINCT div_key FROM matches
+            WHERE div_key IS NOT NULL
         '''
         divisions = pd.read_sql_query(query, conn)
         conn.close()
         # Applica blacklist case-insensitive
-        raw_list = [d for d in divisions['div'].tolist() if str(d).strip().lower() not in DIVISION_BLACKLIST]
+        raw_list = [d for d in divisions['div_key'].tolist() if d.lower() not in DIVISION_BLACKLIST]
         # Ordina per etichetta visualizzata (A→Z)
         decorated = [(get_division_display_name(d).lower(), d) for d in raw_list]
         decorated.sort(key=lambda t: t[0])
         return [d for _, d in decorated]
     
-    def get_matches_data(self, seasons=None, divisions=None):
+    def get_matches_data(self, seasons=None, divisions=None, teams=None, columns=None):
         """Ottiene i dati delle partite filtrati per stagione e divisione.
-        Normalizza le stagioni ('.' e '/' -> '-') per evitare mismatch.
+        Filtra sulle colonne chiave season_key/div_key, normalizzando allo stesso modo l'input.
+        Con `teams` restituisce solo le partite (casa o trasferta) di quelle squadre.
+        Con `columns` (es. MATCH_RESULT_COLUMNS) legge solo quelle colonne invece di tutta la
+        riga; i tipi sono quelli di MATCH_COLUMN_DTYPES (gol Int16, squadre/campionato/stagione
+        come categorie). In questo caso squadre e campionato sono letti come id interi e
+        decodificati dai dizionari teams/divisions.
+        Con lo snapshot attivo, `columns` tra quelle dello snapshot e senza `teams`, i dati
+        arrivano dallo snapshot della versione corrente (stesse righe, stesso ordine).
         """
+        codificate = []
+        if columns:
+            selezione = []
+            for col in columns:
+                if not re.fullmatch(r'[a-z_]+', col):
+                    raise ValueError(f"Colonna non valida: {col}")
+                if col in _MATCH_DIMENSION_COLUMNS:
+                    selezione.append(f'{_MATCH_DIMENSION_COLUMNS[col][0]} AS "{col}"')
+                    codificate.append(col)
+                else:
+                    selezione.append(f'"{col}"')
+            select = ', '.join(selezione)
+            if self.snapshots and not teams and set(columns) <= set(_SNAPSHOT_COLUMNS) | {'div_key', 'season_key'}:
+                df = self._read_snapshot(seasons, divisions, columns)
+                if df is not None:
+                    return apply_match_dtypes(df)
+        else:
+            select = '*'
+
         conn = self.get_connection()
-        
-        query = "SELECT * FROM matches WHERE 1=1"
+
+        query = f"SELECT {select} FROM matches WHERE 1=1"
         params = []
         
         if seasons:
-            # Normalizza input
-            norm_seasons = []
-            for s in seasons:
-                s = str(s).strip().replace('.', '-').replace('/', '-')
-                # gestisci anni singoli
-                if s.isdigit() and len(s) == 4:
-                    anno = int(s)
-                    s = f"{anno}-{anno+1}"
-                norm_seasons.append(s)
+            norm_seasons = [_normalize_season_label(s) for s in seasons]
             placeholders = ','.join(['?' for _ in norm_seasons])
-            query += f" AND REPLACE(REPLACE(TRIM(season), '.', '-'), '/', '-') IN ({placeholders})"
+            query += f" AND season_key IN ({placeholders})"
             params.extend(norm_seasons)
         
+        if divisions:
+            placeholders = ','.join(['?' for _ in divisions])
+            query += f" AND div_key IN ({placeholders})"
+            params.extend(str(d).strip() for d in divisions)
+        
+        if teams:
+            placeholders = ','.join(['?' for _ in teams])
+            query += f" AND (home_team IN ({placeholders}) OR away_team IN ({placeholders}))"
+            params.extend(teams)
+            params.extend(teams)
+        
+        query += " ORDER BY match_day DESC, id DESC"
+
+        df = pd.read_sql_query(query, conn, params=params)
+
+        for col in codificate:
+            _, tabella, nome = _MATCH_DIMENSION_COLUMNS[col]
+            df[col] = _decode_dimension(df[col], self._dimension(tabella, nome))
+        conn.close()
+
+        return apply_match_dtypes(df)
+    
+    def refresh_snapshot(self):
+        """Scrive lo snapshot delle partite per la versione corrente dei dati, se attivo.
+        Non solleva eccezioni: senza snapshot get_matches_data continua a leggere da SQLite.
+        """
+        if not self.snapshots:
+            return None
+        try:
+            return write_match_snapshot(self.get_connection(), self.snapshot_root)
+        except Exception as e:
+            logger.warning(f"Snapshot partite non aggiornato: {str(e)}")
+            return None
+
+    def _read_snapshot(self, seasons, divisions, columns):
+        """Partite dallo snapshot della versione corrente (None se manca, non è leggibile o non
+        contiene partite per i filtri). Se manca lo riscrive, una sola volta per versione.
+        """
+        versione = self.get_data_version()
+        try:
+            if self._snapshot is None or self._snapshot.data_version != versione:
+                self._snapshot = None
+                directory = self.snapshot_root / f'v{versione}'
+                if not directory.exists() and self._snapshot_tentato != versione:
+                    self._snapshot_tentato = versione
+                    self.refresh_snapshot()
+                if not directory.exists():
+                    return None
+                self._snapshot = MatchSnapshot(directory)
+            return self._snapshot.read(
+                seasons=[_normalize_season_label(s) for s in seasons] if seasons else None,
+                divisions=[str(d).strip() for d in divisions] if divisions else None,
+                columns=columns,
+                teams=self._dimension('teams', 'name')
+            )
+        except Exception as e:
+            logger.warning(f"Snapshot partite non leggibile, lettura da SQLite: {str(e)}")
+            return None
+
+    def _dimension(self, tabella, nome):
+        """Dizionario teams/divisions (id, nome ordinati per nome). Cambia solo con un import,
+        che incrementa la versione dei dati: resta in memoria finché la versione è la stessa.
+        """
+        return self._per_versione(
+            ('dizionario', tabella), lambda: pd.read_sql_query(f'SELECT id, {nome} FROM {tabella} ORDER BY {nome}', self.get_connection())
+        )
+
+    def get_goals_histogram(self, seasons=None, divisions=None):
+        """Istogramma dei gol per partita dal punto di vista di ogni squadra, calcolato in SQLite.
+
+        Una riga per (venue CASA/FUORI, time TOTALE/I TEMPO/II TEMPO, team, goals) con numero di
+        partite (n) e gol fatti/subiti (gf/ga): è l'input di
+        FootballStatsCalculator.under_over_cube_from_histogram.
+        """
+        conn = self.get_connection()
+
+        where = "1=1"
+        params = []
+
+        if divisions:
+            placeholders = ','.join(['?' for _ in divisions])
+            where += f" AND div IN ({placeholders})"
+            params.extend(divisions)
+
+        if seasons:
+            norm_seasons = [_normalize_season_label(s) for s in seasons]
+            placeholders = ','.join(['?' for _ in norm_seasons])
+            where += f" AND season IN ({placeholders})"
+            params.extend(norm_seasons)
+
+        # Come nel calcolo in pandas: servono il risultato finale e i gol del tempo richiesto
+        halves = []
+        for time_filter, gf, ga in (('TOTALE', 'ft_gf', 'ft_ga'), ('I TEMPO', 'ht_gf', 'ht_ga'), ('II TEMPO', 'sh_gf', 'sh_ga')):
+            halves.append(f"""
+                SELECT venue, '{time_filter}' AS time, team, {gf} + {ga} AS goals, {gf} AS gf, {ga} AS ga
+                FROM team_matches
+                WHERE {where} AND ft_gf IS NOT NULL AND ft_ga IS NOT NULL
+                  AND {gf} IS NOT NULL AND {ga} IS NOT NULL
+            """)
+        query = f"""
+            SELECT venue, time, team, goals, COUNT(*) AS n, SUM(gf) AS gf, SUM(ga) AS ga
+            FROM ({"UNION ALL".join(halves)})
+            GROUP BY venue, time, team, goals
+        """
+
+        df = pd.read_sql_query(query, conn, params=params * 3)
+        conn.close()
+
+        return df
+
+    def get_team_matches(self, seasons=None, divisions=None, teams=None):
+        """Ottiene le righe per squadra (tabella team_matches) filtrate per stagione, divisione e squadra.
+        Ogni partita compare due volte: una per la squadra di casa e una per quella in trasferta.
+        """
+        conn = self.get_connection()
+        
+        query = "SELECT * FROM team_matches WHERE 1=1"
+        params = []
+        
         if divisions:
             placeholders = ','.join(['?' for _ in divisions])
             query += f" AND div IN ({placeholders})"
             params.extend(divisions)
         
-        query += " ORDER BY date DESC"
+        if seasons:
+            placeholders = ','.join(['?' for _ in seasons])
+            query += f" AND season IN ({placeholders})"
+            params.extend(seasons)
+        
+        if teams:
+            placeholders = ','.join(['?' for _ in teams])
+            query += f" AND team IN ({placeholders})"
+            params.extend(teams)
         
+        query += " ORDER BY team, date DESC"
+
         df = pd.read_sql_query(query, conn, params=params)
         conn.close()
-        
+
+        return df
+
+    def get_standings_agg(self, seasons=None, divisions=None, venue=None, half="TOTALE"):
+        """Legge i contatori per squadra dalla tabella standings_agg, sommati sulle stagioni/divisioni scelte.
+
+        Args:
+            venue: "CASA", "FUORI" oppure None/"TOTALE" per entrambe
+            half: "TOTALE", "I TEMPO" o "II TEMPO"
+
+        Ritorna un DataFrame con colonne team, PG, V, N, P, GF, GS.
+        """
+        conn = self.get_connection()
+
+        query = '''
+            SELECT team, SUM(pg) AS PG, SUM(v) AS V, SUM(n) AS N, SUM(p) AS P,
+                   SUM(gf) AS GF, SUM(gs) AS GS
+            FROM standings_agg
+            WHERE half = ?
+        '''
+        params = [half]
+
+        if divisions:
+            placeholders = ','.join(['?' for _ in divisions])
+            query += f" AND div IN ({placeholders})"
+            params.extend(divisions)
+
+        if seasons:
+            norm_seasons = [_normalize_season_label(s) for s in seasons]
+            placeholders = ','.join(['?' for _ in norm_seasons])
+            query += f" AND season IN ({placeholders})"
+            params.extend(norm_seasons)
+
+        if venue in ("CASA", "FUORI"):
+            query += " AND venue = ?"
+            params.append(venue)
+
+        query += " GROUP BY team"
+
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+
         return df
     
     def save_user_preference(self, session_id, key, value):
@@ -718,18 +2119,40 @@ class FootballDatabase:
         return df
     
     def get_imported_files(self):
-        """Ottiene la lista dei file importati"""
+        """Ottiene la lista dei file importati con partite presenti, dai lotti di import:
+        filename, records_count, prima/ultima stagione e data dell'ultimo import
+        """
         conn = self.get_connection()
         query = '''
-            SELECT DISTINCT file_source as filename, COUNT(*) as records_count
-            FROM matches 
-            GROUP BY file_source
-            ORDER BY file_source
+            SELECT file_name as filename, SUM(matches) as records_count,
+                   MIN(first_season) as first_season, MAX(last_season) as last_season,
+                   MAX(finished_at) as last_import
+            FROM import_batches
+            GROUP BY file_name
+            HAVING SUM(matches) > 0
+            ORDER BY file_name
         '''
         df = pd.read_sql_query(query, conn)
         conn.close()
         return df
 
+    def get_dataset_summary(self, group_by='season'):
+        """Partite, prima e ultima data (ISO) raggruppate per 'season', 'div' o 'file_source',
+        lette dalla tabella dataset_summary aggiornata da import ed eliminazioni.
+        Colonne: <group_by>, matches, first_date, last_date (ordinate per <group_by>).
+        """
+        if group_by not in DATASET_SUMMARY_GROUPS:
+            raise ValueError(f"Raggruppamento non valido: {group_by}")
+        conn = self.get_connection()
+        df = pd.read_sql_query(f'''
+            SELECT {group_by}, SUM(matches) AS matches, MIN(first_date) AS first_date, MAX(last_date) AS last_date
+            FROM dataset_summary
+            GROUP BY {group_by}
+            ORDER BY {group_by}
+        ''', conn)
+        conn.close()
+        return df
+
     def get_metric(self, key, default=0):
         """Ottiene il valore di una metrica cumulativa"""
         conn = self.get_connection()
@@ -750,6 +2173,10 @@ class FootballDatabase:
         conn.commit()
         conn.close()
 
+    def get_data_version(self):
+        """Versione corrente dei dati delle partite (cambia ad ogni import/eliminazione/normalizzazione)"""
+        return self.get_metric('data_version')
+
     def purge_old_access_logs(self, older_than_days=60):
         """Elimina log accessi pi f vecchi di N giorni e restituisce numero righe eliminate"""
         conn = self.get_connection()
@@ -770,26 +2197,42 @@ class FootballDatabase:
         """
         Elimina dal database tutti i record collegati ad uno specifico file sorgente.
 
-        Rimuove:
-        - Righe da `matches` con `file_source = file_source_name`
+        Le partite vengono trovate dai lotti di import del file (`import_batches`),
+        tramite l'indice su `matches.batch_id`. Rimuove:
+        - Righe da `matches` dei lotti del file
+        - Righe collegate da `team_matches`
+        - I relativi contatori da `standings_agg` e le righe del file in `dataset_summary`
         - Voci da `mappature_colonne` con `file_origine = file_source_name`
+        - I lotti del file da `import_batches`
 
         Ritorna il numero di partite eliminate dalla tabella `matches`.
         """
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        # Conta righe che verranno eliminate da matches
-        cursor.execute('SELECT COUNT(*) FROM matches WHERE file_source = ?', (file_source_name,))
-        row = cursor.fetchone()
-        deleted_matches = int(row[0]) if row and row[0] is not None else 0
+        cursor.execute('SELECT id FROM import_batches WHERE file_name = ?', (file_source_name,))
+        lotti = [r[0] for r in cursor.fetchall()]
 
-        # Elimina dati
-        cursor.execute('DELETE FROM matches WHERE file_source = ?', (file_source_name,))
+        deleted_matches = 0
+        for batch_id in lotti:
+            # Sottrae le partite del lotto dalle classifiche aggregate
+            cursor.execute(STANDINGS_AGG_DECREMENT_SQL, (batch_id,) * 3)
+            # Elimina dati (prima le righe per squadra collegate alle partite)
+            cursor.execute('''
+                DELETE FROM team_matches
+                WHERE match_id IN (SELECT id FROM matches WHERE batch_id = ?)
+            ''', (batch_id,))
+            cursor.execute('DELETE FROM matches WHERE batch_id = ?', (batch_id,))
+            deleted_matches += cursor.rowcount
+        cursor.execute('DELETE FROM standings_agg WHERE pg <= 0')
+        cursor.execute('DELETE FROM dataset_summary WHERE file_source = ?', (file_source_name,))
         cursor.execute('DELETE FROM mappature_colonne WHERE file_origine = ?', (file_source_name,))
+        cursor.execute('DELETE FROM import_batches WHERE file_name = ?', (file_source_name,))
+        cursor.execute(DATA_VERSION_BUMP_SQL)
 
         conn.commit()
         conn.close()
+        self.refresh_snapshot()
         return deleted_matches
     
     # ------------------------------------------------------------------
@@ -0,0 +1,45 @@
+import argparse
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import FootballDatabase
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Importa più file Excel/CSV in parallelo (lettura in più processi, un solo writer)'
+    )
+    parser.add_argument('files', nargs='+', help='file o pattern (es: data/all-euro-data-*.xlsx)')
+    parser.add_argument('--env', default=os.getenv('APP_ENV', 'test').lower(),
+                        help='ambiente del database: football_stats_<env>.db nella cartella corrente')
+    parser.add_argument('--workers', type=int, default=None, help='processi di lettura (default: CPU)')
+    parser.add_argument('--season', default=None, help='stagione da usare se il file non la indica')
+    args = parser.parse_args(argv)
+
+    file_paths = []
+    for pattern in args.files:
+        trovati = sorted(glob.glob(pattern))
+        file_paths.extend(trovati or [pattern])
+
+    db = FootballDatabase(environment=args.env)
+    riepilogo = db.import_files(file_paths, season=args.season, max_workers=args.workers)
+
+    print(f"{'FILE':<40} {'LETTE':>8} {'NUOVE':>8} {'DOPPIE':>8} {'SCARTATE':>8}")
+    for stats in riepilogo['files']:
+        if 'error' in stats:
+            print(f"{stats['file']:<40} ERRORE: {stats['error']}")
+            continue
+        print(f"{stats['file']:<40} {stats['rows_read']:>8} {stats['inserted']:>8} "
+              f"{stats['duplicates']:>8} {stats['discarded_seasons']:>8}")
+    print(f"\nTotale: {riepilogo['rows_read']} righe lette, {riepilogo['inserted']} importate, "
+          f"{riepilogo['duplicates']} duplicate in {riepilogo['seconds']}s "
+          f"({riepilogo['rows_per_second']} righe/s)")
+
+    return 1 if any('error' in stats for stats in riepilogo['files']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
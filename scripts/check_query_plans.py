@@ -0,0 +1,78 @@
+import os
+import sys
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import FootballDatabase, MATCH_RESULT_COLUMNS
+
+
+def explain(con: sqlite3.Connection, sql: str, params=()) -> list:
+    """Righe 'detail' di EXPLAIN QUERY PLAN per una query"""
+    return [r[3] for r in con.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def full_scans(plan: list) -> list:
+    """Passi del piano che leggono tutta la tabella matches senza indice"""
+    return [d for d in plan if d.startswith('SCAN matches') and 'INDEX' not in d]
+
+
+def main(environment: str = 'test') -> int:
+    # Apre football_stats_<environment>.db nella cartella corrente, come l'app
+    db = FootballDatabase(environment=environment)
+    seasons = db.get_available_seasons()[:2]
+    divisions = db.get_available_divisions()[:2]
+    files = db.get_imported_files()['filename'].tolist()
+    sample = db.get_matches_data(seasons[:1]).head(2)
+    teams = sample['home_team'].tolist()
+    if not seasons or not divisions or not teams:
+        print(f"Nessuna partita in {db.db_path}: importa dei dati prima di controllare i piani delle query")
+        db.close_connection()
+        return 1
+
+    # Cattura le query SELECT realmente eseguite dai metodi del database
+    captured = []
+    con = db.get_connection()
+    con.set_trace_callback(lambda sql: captured.append((current, sql)))
+    # Stagioni e campionati passano dalla cache per versione dei dati (che legge solo
+    # app_metrics): si tracciano direttamente le query di caricamento
+    calls = [
+        ('get_available_seasons', db._load_available_seasons),
+        ('get_available_divisions', db._load_available_divisions),
+        ('get_imported_files', lambda: db.get_imported_files()),
+        ('get_matches_data', lambda: db.get_matches_data(seasons, divisions)),
+        ('get_matches_data (solo stagioni)', lambda: db.get_matches_data(seasons)),
+        ('get_matches_data (squadre)', lambda: db.get_matches_data(seasons, divisions, teams=teams)),
+        ('get_matches_data (solo squadre)', lambda: db.get_matches_data(teams=teams)),
+        # Forma di Best Teams: partite delle squadre mostrate, colonne dei risultati
+        ('partite di una squadra',
+         lambda: db.get_matches_data(seasons, [], teams=teams[:1], columns=MATCH_RESULT_COLUMNS)),
+    ]
+    for current, call in calls:
+        call()
+    con.set_trace_callback(None)
+
+    checks = [(name, sql, ()) for name, sql in captured if sql.lstrip().upper().startswith('SELECT')]
+    # Le DELETE di delete_file_data non si eseguono: si controlla solo il piano
+    if files:
+        batch_id = con.execute('SELECT id FROM import_batches WHERE file_name = ?', (files[0],)).fetchone()[0]
+        checks.append(('delete_file_data (matches)', 'DELETE FROM matches WHERE batch_id = ?', (batch_id,)))
+        checks.append(('delete_file_data (team_matches)',
+                       'DELETE FROM team_matches WHERE match_id IN (SELECT id FROM matches WHERE batch_id = ?)', (batch_id,)))
+
+    ok = True
+    for name, sql, params in checks:
+        plan = explain(con, sql, params)
+        scans = full_scans(plan)
+        print(f"\n=== {name} {'FULL SCAN' if scans else 'OK'} ===")
+        for d in plan:
+            print(f"  {d}")
+        ok = ok and not scans
+    db.close_connection()
+
+    print('\nTutte le query usano gli indici' if ok else '\nAlcune query leggono tutta la tabella matches')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(os.getenv('APP_ENV', 'test').lower()))
@@ -1,11 +1,121 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from collections import OrderedDict
+import threading
 import streamlit as st
 
+from config import UNDER_OVER_THRESHOLDS, UNDER_OVER_FILTERS
+from database import parse_match_dates, match_day_numbers
+
+def _match_day_values(df):
+    """Giorno di ogni partita come numero (NaN se manca), per ordinare cronologicamente.
+    Usa la colonna match_day calcolata all'import; interpreta il testo di 'date' solo
+    per i DataFrame che non la hanno.
+    """
+    if 'match_day' in df.columns:
+        return pd.to_numeric(df['match_day'], errors='coerce').to_numpy(dtype=float)
+    return match_day_numbers(parse_match_dates(df['date'])).to_numpy(dtype=float, na_value=np.nan)
+
+def _team_codes(df):
+    """Squadre di casa e trasferta come codici interi su un unico elenco di nomi.
+    Con le categorie condivise di get_matches_data usa direttamente i loro codici,
+    altrimenti codifica i nomi una volta (-1 = squadra mancante).
+    Ritorna (codici casa, codici trasferta, nomi).
+    """
+    home, away = df['home_team'], df['away_team']
+    if isinstance(home.dtype, pd.CategoricalDtype) and home.dtype == away.dtype:
+        return home.cat.codes.to_numpy(), away.cat.codes.to_numpy(), home.cat.categories
+    codes, names = pd.factorize(np.concatenate([home.to_numpy(dtype=object), away.to_numpy(dtype=object)]), sort=True)
+    return codes[:len(df)], codes[len(df):], pd.Index(names)
+
+def _team_labels(codes, names):
+    """Colonna squadra dai codici di _team_codes: categorie, senza ricreare il testo per ogni riga"""
+    return pd.Categorical.from_codes(codes, categories=names)
+
+class ResultCache:
+    """
+    Cache LRU dei risultati calcolati (classifiche, tabelle Under/Over...), condivisa
+    tra le sessioni. Le voci valgono per una versione dei dati del database:
+    quando la versione cambia la cache viene svuotata.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._data_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, data_version, key, compute):
+        """Restituisce il risultato per key, calcolandolo con compute() se assente"""
+        with self._lock:
+            if data_version != self._data_version:
+                self._entries.clear()
+                self._data_version = data_version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._copy(self._entries[key])
+            self.misses += 1
+
+        # Il calcolo avviene fuori dal lock per non serializzare le sessioni
+        result = compute()
+
+        with self._lock:
+            if data_version == self._data_version:
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return self._copy(result)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Contatori hit/miss e occupazione della cache"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'data_version': self._data_version
+            }
+
+    @staticmethod
+    def _copy(result):
+        # I chiamanti modificano i DataFrame (colonne Forma, rinomina...): mai restituire l'originale
+        if isinstance(result, (pd.DataFrame, pd.Series)):
+            return result.copy()
+        if isinstance(result, dict):
+            return {key: ResultCache._copy(value) for key, value in result.items()}
+        return result
+
 class FootballStatsCalculator:
-    def __init__(self, db):
+    def __init__(self, db, cache_size=128):
         self.db = db
+        self.result_cache = ResultCache(cache_size)
+
+    @staticmethod
+    def result_key(kind, seasons=None, divisions=None, **params):
+        """
+        Impronta di una richiesta: tipo di risultato, stagioni, campionati e parametri
+        (standings_type, venue, exclude_top, exclude_bottom, threshold, ...).
+        """
+        return (
+            kind,
+            tuple(sorted(str(s) for s in seasons or [])),
+            tuple(sorted(str(d) for d in divisions or [])),
+            tuple(sorted(params.items()))
+        )
+
+    def cached_result(self, key, compute):
+        """Risultato dalla cache LRU (vedi result_key), ricalcolato se i dati del DB sono cambiati"""
+        return self.result_cache.get_or_compute(self.db.get_data_version(), key, compute)
     
     def calculate_standings(self, matches_df, standings_type="total", exclude_top=None, exclude_bottom=None, venue_filter="TOTALE"):
         """
@@ -24,404 +134,418 @@ class FootballStatsCalculator:
         # Prepara i dati
         df = matches_df.copy()
         
-        # Converte le colonne necessarie
-        df['ft_home_goals'] = pd.to_numeric(df['ft_home_goals'], errors='coerce')
-        df['ft_away_goals'] = pd.to_numeric(df['ft_away_goals'], errors='coerce')
-        df['ht_home_goals'] = pd.to_numeric(df['ht_home_goals'], errors='coerce')
-        df['ht_away_goals'] = pd.to_numeric(df['ht_away_goals'], errors='coerce')
+        # Converte le colonne necessarie (float: gli Int16 di get_matches_data hanno NA, non NaN)
+        df['ft_home_goals'] = pd.to_numeric(df['ft_home_goals'], errors='coerce').astype(float)
+        df['ft_away_goals'] = pd.to_numeric(df['ft_away_goals'], errors='coerce').astype(float)
+        df['ht_home_goals'] = pd.to_numeric(df['ht_home_goals'], errors='coerce').astype(float)
+        df['ht_away_goals'] = pd.to_numeric(df['ht_away_goals'], errors='coerce').astype(float)
         
         # Rimuove righe con dati mancanti
         df = df.dropna(subset=['ft_home_goals', 'ft_away_goals'])
         
-        standings_data = []
-        
-        # Ottiene tutte le squadre uniche
-        all_teams = set(df['home_team'].unique()) | set(df['away_team'].unique())
+        # Costruisce la vista per squadra e aggrega tutte le squadre in un solo passaggio
+        team_rows = self._team_perspective(df, standings_type, venue_filter)
+        return self._standings_from_team_rows(team_rows, exclude_top, exclude_bottom)
+    
+    def calculate_standings_from_team_matches(self, team_matches_df, standings_type="total", exclude_top=None, exclude_bottom=None, venue_filter="TOTALE"):
+        """
+        Calcola le classifiche partendo dalle righe per squadra già materializzate
+        (tabella team_matches, vedi FootballDatabase.get_team_matches).
         
-        for team in all_teams:
-            team_stats = self._calculate_team_stats(df, team, standings_type, venue_filter)
-            if team_stats:
-                standings_data.append(team_stats)
+        Args:
+            team_matches_df: DataFrame con due righe per partita (una per squadra)
+            standings_type: "total", "first_half", "second_half"
+            exclude_top: numero di squadre da escludere dalla cima
+            exclude_bottom: numero di squadre da escludere dal fondo
+            venue_filter: "TOTALE", "CASA", "FUORI"
+        """
+        if team_matches_df.empty:
+            return pd.DataFrame()
         
-        if not standings_data:
+        if standings_type == "first_half":
+            goal_columns = ('ht_gf', 'ht_ga')
+        elif standings_type == "second_half":
+            goal_columns = ('sh_gf', 'sh_ga')
+        else:
+            goal_columns = ('ft_gf', 'ft_ga')
+        
+        df = team_matches_df
+        if venue_filter in ("CASA", "FUORI"):
+            df = df[df['venue'] == venue_filter]
+        # Le partite senza risultato finale non entrano in classifica
+        df = df.dropna(subset=['ft_gf', 'ft_ga'])
+        
+        team_rows = pd.DataFrame({
+            'team': df['team'].to_numpy(),
+            'opponent': df['opponent'].to_numpy(),
+            'venue': df['venue'].to_numpy(),
+            'gf': pd.to_numeric(df[goal_columns[0]], errors='coerce').to_numpy(dtype=float),
+            'ga': pd.to_numeric(df[goal_columns[1]], errors='coerce').to_numpy(dtype=float)
+        }).dropna(subset=['gf', 'ga'])
+        
+        return self._standings_from_team_rows(self._with_outcome(team_rows), exclude_top, exclude_bottom)
+
+    def calculate_standings_from_agg(self, agg_df):
+        """
+        Classifica a partire dai contatori già aggregati per squadra
+        (tabella standings_agg, vedi FootballDatabase.get_standings_agg).
+        Non supporta le esclusioni: servono gli scontri diretti, quindi le righe per squadra.
+        """
+        if agg_df is None or agg_df.empty:
             return pd.DataFrame()
+
+        counts = agg_df.set_index('team').sort_index()[['PG', 'V', 'N', 'P', 'GF', 'GS']]
+        standings_df = self._finalize_standings(counts)
+        if standings_df.empty:
+            return pd.DataFrame()
+
+        standings_df = standings_df.sort_values(['PT', 'DF'], ascending=[False, False])
+        standings_df['PZ'] = range(1, len(standings_df) + 1)
+
+        return standings_df
+
+    def _standings_from_team_rows(self, team_rows, exclude_top=None, exclude_bottom=None):
+        """Aggrega le righe per squadra, applica le esclusioni e assegna le posizioni"""
+        standings_df = self._aggregate_standings(team_rows)
         
-        standings_df = pd.DataFrame(standings_data)
+        if standings_df.empty:
+            return pd.DataFrame()
         
-        # Applica sempre il nuovo metodo per garantire calcoli corretti
-        # anche quando exclude_top e exclude_bottom sono entrambi 0
-        standings_df = self._apply_exclusions(standings_df, exclude_top, exclude_bottom, matches_df, standings_type, venue_filter)
+        # Esclusioni (classifiche con parametri): riusa le righe per squadra già calcolate
+        standings_df = self._apply_exclusions(standings_df, team_rows, exclude_top, exclude_bottom)
+        if standings_df.empty:
+            return pd.DataFrame()
         
         # Ordina per punti e differenza reti
-        if 'PT' in standings_df.columns and 'DF' in standings_df.columns:
-            standings_df = standings_df.sort_values(['PT', 'DF'], ascending=[False, False])
-        else:
-            # Fallback per compatibilità
-            standings_df = standings_df.sort_values(['points', 'goal_difference'], ascending=[False, False])
+        standings_df = standings_df.sort_values(['PT', 'DF'], ascending=[False, False])
         standings_df['PZ'] = range(1, len(standings_df) + 1)
         
         return standings_df
     
-    def _calculate_team_stats(self, df, team, standings_type, venue_filter="TOTALE"):
-        """Calcola le statistiche per una singola squadra"""
-        # Partite in casa
-        home_matches = df[df['home_team'] == team].copy()
-        # Partite in trasferta
-        away_matches = df[df['away_team'] == team].copy()
-        
-        # Applica filtro venue
-        if venue_filter == "CASA":
-            away_matches = pd.DataFrame()  # Esclude partite fuori casa
-        elif venue_filter == "FUORI":
-            home_matches = pd.DataFrame()  # Esclude partite in casa
-        
-        if home_matches.empty and away_matches.empty:
-            return None
-        
-        stats = {
-            'team': team,
-            'PG': 0,
-            'V': 0,
-            'N': 0,
-            'P': 0,
-            'GF': 0,
-            'GS': 0,
-            'DF': 0,
-            'PT': 0,
-            'V%': 0,
-            'N%': 0,
-            'P%': 0
-        }
+    def _team_perspective(self, df, standings_type="total", venue_filter="TOTALE"):
+        """
+        Trasforma le partite in righe per squadra (una riga per la squadra di casa
+        e una per quella in trasferta) con gol fatti/subiti ed esito dal punto di
+        vista della squadra.
         
-        # Processa partite in casa
-        for _, match in home_matches.iterrows():
-            stats['PG'] += 1
-            
-            if standings_type == "total":
-                goals_for = match['ft_home_goals']
-                goals_against = match['ft_away_goals']
-                result = match['ft_result']
-            elif standings_type == "first_half":
-                goals_for = match['ht_home_goals']
-                goals_against = match['ht_away_goals']
-                result = match['ht_result']
-            elif standings_type == "second_half":
-                goals_for = match['ft_home_goals'] - match['ht_home_goals']
-                goals_against = match['ft_away_goals'] - match['ht_away_goals']
-                # Determina il risultato del secondo tempo
-                if goals_for > goals_against:
-                    result = 'H'
-                elif goals_for < goals_against:
-                    result = 'A'
-                else:
-                    result = 'D'
-            else:
-                continue
-            
-            stats['GF'] += goals_for
-            stats['GS'] += goals_against
-            
-            if result == 'H':
-                stats['V'] += 1
-                stats['PT'] += 3
-            elif result == 'D':
-                stats['N'] += 1
-                stats['PT'] += 1
-            else:
-                stats['P'] += 1
-        
-        # Processa partite in trasferta
-        for _, match in away_matches.iterrows():
-            stats['PG'] += 1
-            
-            if standings_type == "total":
-                goals_for = match['ft_away_goals']
-                goals_against = match['ft_home_goals']
-                result = match['ft_result']
-            elif standings_type == "first_half":
-                goals_for = match['ht_away_goals']
-                goals_against = match['ht_home_goals']
-                result = match['ht_result']
-            elif standings_type == "second_half":
-                goals_for = match['ft_away_goals'] - match['ht_away_goals']
-                goals_against = match['ft_home_goals'] - match['ht_home_goals']
-                # Determina il risultato del secondo tempo
-                if goals_for > goals_against:
-                    result = 'A'
-                elif goals_for < goals_against:
-                    result = 'H'
-                else:
-                    result = 'D'
-            else:
-                continue
-            
-            stats['GF'] += goals_for
-            stats['GS'] += goals_against
-            
-            if result == 'A':
-                stats['V'] += 1
-                stats['PT'] += 3
-            elif result == 'D':
-                stats['N'] += 1
-                stats['PT'] += 1
-            else:
-                stats['P'] += 1
+        Args:
+            df: DataFrame partite con gol già numerici
+            standings_type: "total", "first_half", "second_half" (altri valori = totale)
+            venue_filter: "TOTALE", "CASA", "FUORI"
+        """
+        if standings_type == "first_half":
+            home_goals = df['ht_home_goals']
+            away_goals = df['ht_away_goals']
+        elif standings_type == "second_half":
+            home_goals = df['ft_home_goals'] - df['ht_home_goals']
+            away_goals = df['ft_away_goals'] - df['ht_away_goals']
+        else:
+            home_goals = df['ft_home_goals']
+            away_goals = df['ft_away_goals']
+        
+        # Squadre come codici interi: le righe e il groupby lavorano su interi, non su testo
+        home_codes, away_codes, names = _team_codes(df)
+        parts = []
+        if venue_filter != "FUORI":
+            parts.append(pd.DataFrame({
+                'team': _team_labels(home_codes, names),
+                'opponent': _team_labels(away_codes, names),
+                'venue': 'CASA',
+                'gf': home_goals.to_numpy(dtype=float),
+                'ga': away_goals.to_numpy(dtype=float)
+            }))
+        if venue_filter != "CASA":
+            parts.append(pd.DataFrame({
+                'team': _team_labels(away_codes, names),
+                'opponent': _team_labels(home_codes, names),
+                'venue': 'FUORI',
+                'gf': away_goals.to_numpy(dtype=float),
+                'ga': home_goals.to_numpy(dtype=float)
+            }))
+        
+        team_rows = pd.concat(parts, ignore_index=True)
+        # Scarta le partite senza gol per il tempo richiesto (es. file senza dati I tempo)
+        team_rows = team_rows.dropna(subset=['gf', 'ga'])
+        
+        return self._with_outcome(team_rows)
+    
+    def _with_outcome(self, team_rows):
+        """Aggiunge l'esito V/N/P dal punto di vista della squadra confrontando gf e ga"""
+        diff = team_rows['gf'].to_numpy() - team_rows['ga'].to_numpy()
+        team_rows['outcome'] = np.select([diff > 0, diff == 0], ['V', 'N'], default='P')
+        return team_rows
+    
+    def _aggregate_standings(self, team_rows):
+        """Aggrega le righe per squadra in una classifica (PG/V/N/P/GF/GS) con un solo groupby"""
+        if team_rows.empty:
+            return pd.DataFrame()
         
-        # Calcola differenza reti e percentuali
-        stats['DF'] = stats['GF'] - stats['GS']
+        counts = team_rows.assign(
+            V=team_rows['outcome'] == 'V',
+            N=team_rows['outcome'] == 'N',
+            P=team_rows['outcome'] == 'P'
+        ).groupby('team', sort=True).agg(
+            PG=('outcome', 'size'),
+            V=('V', 'sum'),
+            N=('N', 'sum'),
+            P=('P', 'sum'),
+            GF=('gf', 'sum'),
+            GS=('ga', 'sum')
+        )
+        # Squadre di nuovo come testo (in ordine alfabetico) per la tabella finale
+        counts.index = counts.index.astype(str)
+        return self._finalize_standings(counts.sort_index())
+    
+    def _finalize_standings(self, counts):
+        """Completa una tabella di conteggi per squadra con DF, PT e percentuali"""
+        table = counts.astype(int)
+        table = table[table['PG'] > 0]
+        if table.empty:
+            return pd.DataFrame()
         
-        if stats['PG'] > 0:
-            stats['V%'] = round((stats['V'] / stats['PG']) * 100, 2)
-            stats['N%'] = round((stats['N'] / stats['PG']) * 100, 2)
-            stats['P%'] = round((stats['P'] / stats['PG']) * 100, 2)
+        table['DF'] = table['GF'] - table['GS']
+        table['PT'] = table['V'] * 3 + table['N']
+        table['V%'] = (table['V'] / table['PG'] * 100).round(2)
+        table['N%'] = (table['N'] / table['PG'] * 100).round(2)
+        table['P%'] = (table['P'] / table['PG'] * 100).round(2)
         
-        return stats
+        table = table.reset_index()
+        return table[['team', 'PG', 'V', 'N', 'P', 'GF', 'GS', 'DF', 'PT', 'V%', 'N%', 'P%']]
     
-    def _apply_exclusions(self, standings_df, exclude_top, exclude_bottom, matches_df, standings_type, venue_filter):
-        """Applica le esclusioni per le classifiche con parametri"""
-        # Identifica le squadre da escludere
+    def _apply_exclusions(self, standings_df, team_rows, exclude_top, exclude_bottom):
+        """
+        Applica le esclusioni per le classifiche con parametri.
+        
+        Le squadre escluse (prime/ultime della classifica base) restano in classifica:
+        a tutte le squadre vengono sottratti solo gli scontri diretti contro di esse,
+        aggregati con un unico groupby sulle righe per squadra già calcolate.
+        """
+        if not exclude_top and not exclude_bottom:
+            return standings_df
+        
+        # Identifica le squadre da escludere sulla classifica base ordinata
+        ranked = standings_df.sort_values(['PT', 'DF'], ascending=[False, False])
         excluded_teams = []
         if exclude_top:
-            top_teams = standings_df.head(exclude_top)['team'].tolist()
-            excluded_teams.extend(top_teams)
+            excluded_teams.extend(ranked.head(exclude_top)['team'].tolist())
         if exclude_bottom:
-            bottom_teams = standings_df.tail(exclude_bottom)['team'].tolist()
-            excluded_teams.extend(bottom_teams)
+            excluded_teams.extend(ranked.tail(exclude_bottom)['team'].tolist())
         
-        # Ricalcola le classifiche escludendo solo gli scontri diretti contro le squadre escluse
-        standings_data = []
+        h2h_rows = team_rows[team_rows['opponent'].isin(excluded_teams)]
+        if h2h_rows.empty:
+            return standings_df
         
-        # Ottiene tutte le squadre originali (non filtrate)
-        all_teams = set(matches_df['home_team'].unique()) | set(matches_df['away_team'].unique())
+        count_columns = ['PG', 'V', 'N', 'P', 'GF', 'GS']
+        base_counts = standings_df.set_index('team')[count_columns]
+        h2h_counts = self._aggregate_standings(h2h_rows).set_index('team')[count_columns]
         
-        for team in all_teams:
-            # Per ogni squadra, calcola le statistiche escludendo solo le partite contro le squadre escluse
-            team_stats = self._calculate_team_stats_with_exclusions(
-                matches_df, team, standings_type, venue_filter, excluded_teams
-            )
-            if team_stats:
-                standings_data.append(team_stats)
-        
-        if not standings_data:
+        return self._finalize_standings(base_counts.sub(h2h_counts, fill_value=0))
+    
+    def calculate_under_over_standings(self, matches_df, threshold=2.5, venue_filter="TOTALE", time_filter="TOTALE"):
+        """Calcola le classifiche Under/Over per una soglia specifica"""
+        if matches_df.empty:
             return pd.DataFrame()
         
-        filtered_standings_df = pd.DataFrame(standings_data)
+        cube = self.calculate_under_over_cube(matches_df, [threshold])
+        return self.under_over_standings_from_cube(cube, threshold, venue_filter, time_filter)
+    
+    def calculate_under_over_cube(self, matches_df, thresholds=None):
+        """
+        Calcola in un solo passaggio i conteggi Under/Over per squadra per tutte le soglie
+        e tutte le combinazioni venue (TOTALE/CASA/FUORI) × tempo (TOTALE/I TEMPO/II TEMPO).
         
-        # Ordina per punti e differenza reti
-        if 'PT' in filtered_standings_df.columns and 'DF' in filtered_standings_df.columns:
-            filtered_standings_df = filtered_standings_df.sort_values(['PT', 'DF'], ascending=[False, False])
-        else:
-            filtered_standings_df = filtered_standings_df.sort_values(['points', 'goal_difference'], ascending=[False, False])
+        Args:
+            matches_df: DataFrame con i dati delle partite
+            thresholds: soglie da calcolare (default: config.UNDER_OVER_THRESHOLDS)
         
-        filtered_standings_df['PZ'] = range(1, len(filtered_standings_df) + 1)
+        Returns:
+            DataFrame lungo con colonne venue, time, team, threshold, PG, U, O, GF, GS.
+            Cambiare soglia/filtro è un semplice filtro su questo DataFrame
+            (vedi under_over_standings_from_cube).
+        """
+        if matches_df.empty:
+            return pd.DataFrame()
         
-        return filtered_standings_df
+        return self.under_over_cube_from_histogram(self._goals_histogram(matches_df), thresholds)
     
-    def _calculate_team_stats_with_exclusions(self, df, team, standings_type, venue_filter, excluded_teams):
-        """Calcola le statistiche per una singola squadra escludendo le partite contro le squadre escluse"""
-        # Partite in casa (escludendo quelle contro squadre escluse)
-        home_matches = df[(df['home_team'] == team) & (~df['away_team'].isin(excluded_teams))].copy()
-        # Partite in trasferta (escludendo quelle contro squadre escluse)
-        away_matches = df[(df['away_team'] == team) & (~df['home_team'].isin(excluded_teams))].copy()
-        
-        # Applica filtro venue
-        if venue_filter == "CASA":
-            away_matches = pd.DataFrame()  # Esclude partite fuori casa
-        elif venue_filter == "FUORI":
-            home_matches = pd.DataFrame()  # Esclude partite in casa
-        
-        if home_matches.empty and away_matches.empty:
-            return None
-        
-        stats = {
-            'team': team,
-            'PG': 0,
-            'V': 0,
-            'N': 0,
-            'P': 0,
-            'GF': 0,
-            'GS': 0,
-            'DF': 0,
-            'PT': 0,
-            'V%': 0,
-            'N%': 0,
-            'P%': 0
+    def _goals_histogram(self, matches_df):
+        """
+        Istogramma dei gol totali per partita dal punto di vista di ogni squadra.
+        Una riga per (venue CASA/FUORI, time, team, goals) con numero partite (n)
+        e somma dei gol fatti/subiti (gf/ga).
+        """
+        df = matches_df
+        ft_home = pd.to_numeric(df['ft_home_goals'], errors='coerce').to_numpy(dtype=float)
+        ft_away = pd.to_numeric(df['ft_away_goals'], errors='coerce').to_numpy(dtype=float)
+        ht_home = pd.to_numeric(df['ht_home_goals'], errors='coerce').to_numpy(dtype=float)
+        ht_away = pd.to_numeric(df['ht_away_goals'], errors='coerce').to_numpy(dtype=float)
+        home_codes, away_codes, names = _team_codes(df)
+        
+        halves = {
+            "TOTALE": (ft_home, ft_away),
+            "I TEMPO": (ht_home, ht_away),
+            "II TEMPO": (ft_home - ht_home, ft_away - ht_away)
         }
         
-        # Processa partite in casa
-        for _, match in home_matches.iterrows():
-            stats['PG'] += 1
-            
-            home_goals = int(match['ft_home_goals']) if pd.notna(match['ft_home_goals']) else 0
-            away_goals = int(match['ft_away_goals']) if pd.notna(match['ft_away_goals']) else 0
-            
-            stats['GF'] += home_goals
-            stats['GS'] += away_goals
-            
-            if home_goals > away_goals:
-                stats['V'] += 1
-                stats['PT'] += 3
-            elif home_goals == away_goals:
-                stats['N'] += 1
-                stats['PT'] += 1
-            else:
-                stats['P'] += 1
-        
-        # Processa partite in trasferta
-        for _, match in away_matches.iterrows():
-            stats['PG'] += 1
-            
-            home_goals = int(match['ft_home_goals']) if pd.notna(match['ft_home_goals']) else 0
-            away_goals = int(match['ft_away_goals']) if pd.notna(match['ft_away_goals']) else 0
-            
-            stats['GF'] += away_goals
-            stats['GS'] += home_goals
-            
-            if away_goals > home_goals:
-                stats['V'] += 1
-                stats['PT'] += 3
-            elif away_goals == home_goals:
-                stats['N'] += 1
-                stats['PT'] += 1
-            else:
-                stats['P'] += 1
-        
-        # Calcola differenza reti
-        stats['DF'] = stats['GF'] - stats['GS']
-        
-        # Calcola percentuali
-        if stats['PG'] > 0:
-            stats['V%'] = round((stats['V'] / stats['PG']) * 100, 2)
-            stats['N%'] = round((stats['N'] / stats['PG']) * 100, 2)
-            stats['P%'] = round((stats['P'] / stats['PG']) * 100, 2)
-        
-        return stats
+        parts = []
+        for time_filter, (home_goals, away_goals) in halves.items():
+            # Scarta le partite senza risultato finale o senza gol per il tempo richiesto
+            valid = ~(np.isnan(ft_home) | np.isnan(ft_away) | np.isnan(home_goals) | np.isnan(away_goals))
+            parts.append(pd.DataFrame({
+                'venue': 'CASA', 'time': time_filter, 'team': home_codes[valid],
+                'gf': home_goals[valid], 'ga': away_goals[valid]
+            }))
+            parts.append(pd.DataFrame({
+                'venue': 'FUORI', 'time': time_filter, 'team': away_codes[valid],
+                'gf': away_goals[valid], 'ga': home_goals[valid]
+            }))
+        
+        rows = pd.concat(parts, ignore_index=True)
+        rows['goals'] = (rows['gf'] + rows['ga']).astype(int)
+        
+        histogram = rows[rows['team'] >= 0].groupby(['venue', 'time', 'team', 'goals'], sort=False).agg(
+            n=('goals', 'size'),
+            gf=('gf', 'sum'),
+            ga=('ga', 'sum')
+        ).reset_index()
+        # Raggruppato sui codici interi delle squadre: i nomi tornano solo sulle righe aggregate
+        histogram['team'] = names.to_numpy()[histogram['team'].to_numpy()]
+        return histogram
     
-    def calculate_under_over_standings(self, matches_df, threshold=2.5, venue_filter="TOTALE", time_filter="TOTALE"):
-        """Calcola le classifiche Under/Over per una soglia specifica"""
-        if matches_df.empty:
+    def under_over_cube_from_histogram(self, histogram, thresholds=None):
+        """
+        Costruisce il cubo Under/Over da un istogramma dei gol
+        (colonne venue CASA/FUORI, time, team, goals, n, gf, ga).
+        """
+        if histogram.empty:
             return pd.DataFrame()
         
-        df = matches_df.copy()
-        df['ft_home_goals'] = pd.to_numeric(df['ft_home_goals'], errors='coerce')
-        df['ft_away_goals'] = pd.to_numeric(df['ft_away_goals'], errors='coerce')
-        df['ht_home_goals'] = pd.to_numeric(df['ht_home_goals'], errors='coerce')
-        df['ht_away_goals'] = pd.to_numeric(df['ht_away_goals'], errors='coerce')
-        df = df.dropna(subset=['ft_home_goals', 'ft_away_goals'])
+        thresholds = list(UNDER_OVER_THRESHOLDS) if thresholds is None else list(thresholds)
+        
+        # Il venue TOTALE è la somma di CASA e FUORI
+        histogram = pd.concat([histogram, histogram.assign(venue="TOTALE")], ignore_index=True)
+        keys = ['venue', 'time', 'team']
         
-        standings_data = []
-        all_teams = set(df['home_team'].unique()) | set(df['away_team'].unique())
+        totals = histogram.groupby(keys).agg(PG=('n', 'sum'), GF=('gf', 'sum'), GS=('ga', 'sum'))
         
-        for team in all_teams:
-            team_stats = self._calculate_under_over_stats(df, team, threshold, venue_filter, time_filter)
-            if team_stats:
-                standings_data.append(team_stats)
+        # Cumulata sull'istogramma: partite con al massimo k gol
+        counts = histogram.pivot_table(index=keys, columns='goals', values='n', aggfunc='sum', fill_value=0)
+        counts = counts.reindex(columns=range(int(histogram['goals'].max()) + 1), fill_value=0)
+        cumulative = counts.cumsum(axis=1).reindex(totals.index).to_numpy()
+        max_goals = cumulative.shape[1] - 1
+        
+        cubes = []
+        for threshold in thresholds:
+            # Under = totale gol < soglia, cioè al massimo ceil(soglia) - 1 gol
+            limit = int(np.ceil(threshold)) - 1
+            if limit < 0:
+                under = np.zeros(len(totals), dtype=int)
+            else:
+                under = cumulative[:, min(limit, max_goals)]
+            cube = totals.copy()
+            cube['threshold'] = threshold
+            cube['U'] = under
+            cube['O'] = cube['PG'] - cube['U']
+            cubes.append(cube)
+        
+        cube = pd.concat(cubes).reset_index()
+        cube[['PG', 'U', 'O', 'GF', 'GS']] = cube[['PG', 'U', 'O', 'GF', 'GS']].astype(int)
+        return cube[['venue', 'time', 'team', 'threshold', 'PG', 'U', 'O', 'GF', 'GS']]
+    
+    def under_over_standings_from_cube(self, cube, threshold=2.5, venue_filter="TOTALE", time_filter="TOTALE"):
+        """Estrae dal cubo Under/Over la classifica per soglia, venue e tempo richiesti"""
+        if cube.empty:
+            return pd.DataFrame()
         
-        if not standings_data:
+        standings_df = cube[
+            (cube['venue'] == venue_filter) &
+            (cube['time'] == time_filter) &
+            (cube['threshold'] == threshold)
+        ]
+        if standings_df.empty:
             return pd.DataFrame()
         
-        standings_df = pd.DataFrame(standings_data)
+        return self._under_over_table(standings_df)
+    
+    def calculate_under_over_tables(self, matches_df, threshold=2.5):
+        """
+        Tutte le nove classifiche Under/Over (venue × tempo, vedi config.UNDER_OVER_FILTERS)
+        per una soglia, da un unico passaggio sulle partite.
+        Ritorna un dict etichetta filtro -> classifica (DataFrame vuoto se senza dati).
+        """
+        if matches_df.empty:
+            return {label: pd.DataFrame() for label in UNDER_OVER_FILTERS}
+        
+        return self.under_over_tables_from_cube(self.calculate_under_over_cube(matches_df, [threshold]), threshold)
+    
+    def under_over_tables_from_cube(self, cube, threshold=2.5):
+        """Come calculate_under_over_tables, partendo da un cubo già calcolato"""
+        tables = {label: pd.DataFrame() for label in UNDER_OVER_FILTERS}
+        if cube.empty:
+            return tables
+        
+        by_filter = dict(list(cube[cube['threshold'] == threshold].groupby(['venue', 'time'], sort=False)))
+        for label, venue_time in UNDER_OVER_FILTERS.items():
+            if venue_time in by_filter:
+                tables[label] = self._under_over_table(by_filter[venue_time])
+        return tables
+    
+    def _under_over_table(self, cube_slice):
+        """Classifica Under/Over (G/P, U%, O%, Gioca) da una fetta del cubo con venue, tempo e soglia fissati"""
+        standings_df = cube_slice[['team', 'PG', 'U', 'O', 'GF', 'GS']].copy()
+        standings_df['G/P'] = ((standings_df['GF'] + standings_df['GS']) / standings_df['PG']).round(2)
         
         # Calcola percentuali
-        standings_df['U%'] = standings_df.apply(lambda row: round((row['U'] / row['PG']) * 100, 2) if row['PG'] > 0 else 0, axis=1)
-        standings_df['O%'] = standings_df.apply(lambda row: round((row['O'] / row['PG']) * 100, 2) if row['PG'] > 0 else 0, axis=1)
+        standings_df['U%'] = (standings_df['U'] / standings_df['PG'] * 100).round(2)
+        standings_df['O%'] = (standings_df['O'] / standings_df['PG'] * 100).round(2)
         
         # Determina "Gioca"
-        standings_df['Gioca'] = standings_df.apply(
-            lambda row: 'U' if row['U%'] > row['O%'] else ('O' if row['O%'] > row['U%'] else '-'), axis=1
+        standings_df['Gioca'] = np.select(
+            [standings_df['U%'] > standings_df['O%'], standings_df['O%'] > standings_df['U%']],
+            ['U', 'O'],
+            default='-'
         )
         
         # Ordina per O% decrescente
-        standings_df = standings_df.sort_values(by='O%', ascending=False).reset_index(drop=True)
+        standings_df = standings_df.sort_values(by='O%', ascending=False, kind='stable').reset_index(drop=True)
         
         return standings_df
     
-    def _calculate_under_over_stats(self, df, team, threshold, venue_filter="TOTALE", time_filter="TOTALE"):
-        """Calcola le statistiche Under/Over per una squadra"""
-        home_matches = df[df['home_team'] == team]
-        away_matches = df[df['away_team'] == team]
-        
-        if home_matches.empty and away_matches.empty:
-            return None
-        
-        total_matches = 0
-        under_matches = 0
-        over_matches = 0
-        goals_for = 0
-        goals_against = 0
-        
-        # Processa partite in casa
-        if venue_filter in ["TOTALE", "CASA"]:
-            for _, match in home_matches.iterrows():
-                # Calcola gol in base al filtro tempo
-                if time_filter == "I TEMPO":
-                    home_goals = match['ht_home_goals']
-                    away_goals = match['ht_away_goals']
-                elif time_filter == "II TEMPO":
-                    home_goals = match['ft_home_goals'] - match['ht_home_goals']
-                    away_goals = match['ft_away_goals'] - match['ht_away_goals']
-                else:  # TOTALE
-                    home_goals = match['ft_home_goals']
-                    away_goals = match['ft_away_goals']
-                
-                # Assicurati che i gol siano numerici e non NaN
-                home_goals = pd.to_numeric(home_goals, errors='coerce')
-                away_goals = pd.to_numeric(away_goals, errors='coerce')
-                if pd.isna(home_goals): home_goals = 0
-                if pd.isna(away_goals): away_goals = 0
-                
-                total_goals = home_goals + away_goals
-                total_matches += 1
-                goals_for += home_goals
-                goals_against += away_goals
-                
-                if total_goals < threshold:
-                    under_matches += 1
-                else:
-                    over_matches += 1
-        
-        # Processa partite in trasferta
-        if venue_filter in ["TOTALE", "FUORI"]:
-            for _, match in away_matches.iterrows():
-                # Calcola gol in base al filtro tempo
-                if time_filter == "I TEMPO":
-                    home_goals = match['ht_home_goals']
-                    away_goals = match['ht_away_goals']
-                elif time_filter == "II TEMPO":
-                    home_goals = match['ft_home_goals'] - match['ht_home_goals']
-                    away_goals = match['ft_away_goals'] - match['ht_away_goals']
-                else:  # TOTALE
-                    home_goals = match['ft_home_goals']
-                    away_goals = match['ft_away_goals']
-                
-                # Assicurati che i gol siano numerici e non NaN
-                home_goals = pd.to_numeric(home_goals, errors='coerce')
-                away_goals = pd.to_numeric(away_goals, errors='coerce')
-                if pd.isna(home_goals): home_goals = 0
-                if pd.isna(away_goals): away_goals = 0
-                
-                total_goals = home_goals + away_goals
-                total_matches += 1
-                goals_for += away_goals  # Per la squadra in trasferta
-                goals_against += home_goals
-                
-                if total_goals < threshold:
-                    under_matches += 1
-                else:
-                    over_matches += 1
-        
-        if total_matches == 0:
-            return None
-        
-        return {
-            'team': team,
-            'PG': total_matches,
-            'U': under_matches,
-            'O': over_matches,
-            'GF': goals_for,
-            'GS': goals_against,
-            'G/P': round((goals_for + goals_against) / total_matches, 2) if total_matches > 0 else 0
-        }
+    def calculate_best_under_over(self, cube, thresholds=None, venue_filter="TOTALE", time_filter="TOTALE"):
+        """
+        Per ogni squadra trova la soglia con la percentuale Under o Over più alta.
+        
+        A parità di percentuale vince la prima soglia nell'ordine indicato (e Under prima di Over).
+        Restituisce le colonne team, PG, U, O, GF, GS, U%, O%, Pron, Gioca, % (ordinate per % decrescente).
+        """
+        if cube.empty:
+            return pd.DataFrame()
+        
+        thresholds = list(UNDER_OVER_THRESHOLDS) if thresholds is None else list(thresholds)
+        df = cube[
+            (cube['venue'] == venue_filter) &
+            (cube['time'] == time_filter) &
+            (cube['threshold'].isin(thresholds))
+        ].copy()
+        if df.empty:
+            return pd.DataFrame()
+        
+        df['U%'] = (df['U'] / df['PG'] * 100).round(2)
+        df['O%'] = (df['O'] / df['PG'] * 100).round(2)
+        threshold_order = {th: i for i, th in enumerate(thresholds)}
+        df['_order'] = df['threshold'].map(threshold_order)
+        
+        # Candidati Under e Over per ogni soglia, poi il migliore per squadra
+        candidates = pd.concat([
+            df.assign(Gioca='U', _rank=df['_order'] * 2, **{'%': df['U'] / df['PG'] * 100}),
+            df.assign(Gioca='O', _rank=df['_order'] * 2 + 1, **{'%': df['O'] / df['PG'] * 100})
+        ], ignore_index=True)
+        candidates = candidates.sort_values(['team', '%', '_rank'], ascending=[True, False, True])
+        best = candidates.drop_duplicates('team').rename(columns={'threshold': 'Pron'})
+        best['%'] = best['%'].round(2)
+        
+        best = best.sort_values('%', ascending=False, kind='stable').reset_index(drop=True)
+        return best[['team', 'PG', 'U', 'O', 'GF', 'GS', 'U%', 'O%', 'Pron', 'Gioca', '%']]
     
     def calculate_best_standings(self, matches_df, percentage_type="wins", exclude_top=None, exclude_bottom=None):
         """Calcola le classifiche BEST per percentuale specifica"""
@@ -448,18 +572,163 @@ class FootballStatsCalculator:
             standings_df = standings_df.sort_values('P%', ascending=False)
         
         standings_df['PZ'] = range(1, len(standings_df) + 1)
-        
+
         return standings_df
-    
+
+    def calculate_best_teams(self, agg_df, percentage_threshold=70.0):
+        """
+        Classifica BEST: squadre con V%, N% o P% >= soglia, partendo dai contatori per squadra
+        già aggregati (FootballDatabase.get_standings_agg su tutti i campionati).
+        La colonna Gioca indica il primo esito (V, N, P) che supera la soglia.
+        Ordinata per percentuale più alta, a parità per punti e V%.
+        """
+        columns = ['Squadra', 'PG', 'V', 'N', 'P', 'V%', 'N%', 'P%', 'Gioca']
+        if agg_df is None or agg_df.empty:
+            return pd.DataFrame(columns=columns)
+
+        df = agg_df[agg_df['PG'] > 0].rename(columns={'team': 'Squadra'})
+        percentages = df[['V', 'N', 'P']].div(df['PG'], axis=0) * 100
+        above = percentages.ge(percentage_threshold).to_numpy()
+
+        df = df.assign(**{f'{c}%': percentages[c].round(1) for c in ['V', 'N', 'P']})
+        df['Gioca'] = np.select([above[:, 0], above[:, 1], above[:, 2]], ['V', 'N', 'P'], default='')
+        df['PT'] = df['V'] * 3 + df['N']
+        df = df[above.any(axis=1)]
+
+        df = df.sort_values(['PT', 'V%'], ascending=[False, False], kind='stable')
+        df = df.assign(Max_Percentage=df[['V%', 'N%', 'P%']].max(axis=1))
+        df = df.sort_values('Max_Percentage', ascending=False, kind='stable')
+
+        return df[columns].reset_index(drop=True)
+
     def get_team_last_matches(self, matches_df, team, limit=5):
         """Ottiene le ultime N partite di una squadra"""
         team_matches = matches_df[
             (matches_df['home_team'] == team) | (matches_df['away_team'] == team)
         ].copy()
         
-        team_matches = team_matches.sort_values('date', ascending=False)
+        team_matches = team_matches.iloc[np.argsort(-_match_day_values(team_matches), kind='stable')]
         return team_matches.head(limit)
-    
+
+    def assign_competition_phases(self, matches_df, base_matches=22, group_size=6):
+        """
+        Etichetta ogni partita con la fase dei campionati a due fasi (es. Bundesliga austriaca).
+
+        Colonna 'phase':
+        - 'base': tra le prime `base_matches` partite (per data) di almeno una delle due squadre
+        - 'championship': dopo la base, tra due squadre delle prime `group_size` della classifica base
+        - 'relegation': dopo la base, tra due squadre delle ultime `group_size`
+        - 'other': le restanti partite dopo la base
+        Colonna 'conference_playoff': partite dopo la base tra le qualificate al play-off
+        Conference (5a del girone per il titolo, 1a e 2a del girone retrocessione).
+        Con meno di 2 × `group_size` squadre i gironi si sovrappongono e prevale 'championship'.
+        """
+        df = matches_df.copy()
+        n_matches = len(df)
+        phase = np.full(n_matches, 'other', dtype=object)
+        conference = np.zeros(n_matches, dtype=bool)
+        if n_matches == 0:
+            return df.assign(phase=phase, conference_playoff=conference)
+
+        # Un unico ordinamento per data di tutte le righe squadra: le prime N di ogni squadra sono la base
+        position = np.arange(n_matches)
+        match_day = _match_day_values(df)
+        sides = pd.DataFrame({
+            'position': np.concatenate([position, position]),
+            'team': np.concatenate([df['home_team'].to_numpy(), df['away_team'].to_numpy()]),
+            'match_day': np.concatenate([match_day, match_day])
+        }).sort_values(['match_day', 'position'], kind='stable')
+        in_base = sides.groupby('team', sort=False).cumcount().to_numpy() < base_matches
+        is_base = np.zeros(n_matches, dtype=bool)
+        is_base[sides['position'].to_numpy()[in_base]] = True
+        phase[is_base] = 'base'
+
+        base_standings = self.calculate_standings(df[is_base], "total")
+        if base_standings.empty:
+            return df.assign(phase=phase, conference_playoff=conference)
+
+        top_teams = base_standings.head(group_size)['team']
+        bottom_teams = base_standings.tail(group_size)['team']
+        post_base = ~is_base
+        championship = post_base & df['home_team'].isin(top_teams).to_numpy() & df['away_team'].isin(top_teams).to_numpy()
+        relegation = post_base & df['home_team'].isin(bottom_teams).to_numpy() & df['away_team'].isin(bottom_teams).to_numpy()
+        phase[relegation] = 'relegation'
+        phase[championship] = 'championship'
+
+        # Qualificate al play-off Conference dalle classifiche dei due gironi
+        qualified_teams = set()
+        championship_standings = self.calculate_standings(df[championship], "total")
+        if len(championship_standings) >= 5:
+            qualified_teams.add(championship_standings.iloc[4]['team'])
+        relegation_standings = self.calculate_standings(df[relegation], "total")
+        if len(relegation_standings) >= 2:
+            qualified_teams.update(relegation_standings.iloc[:2]['team'])
+        conference = post_base & df['home_team'].isin(qualified_teams).to_numpy() & df['away_team'].isin(qualified_teams).to_numpy()
+
+        return df.assign(phase=phase, conference_playoff=conference)
+
+    def calculate_team_form(self, matches_df, n=5, standings_type="total", venue_filter="TOTALE"):
+        """
+        Ultime n partite di tutte le squadre con un solo ordinamento (colonna "Forma" / "ULTIME 5").
+
+        Args:
+            matches_df: DataFrame delle partite
+            n: numero di partite per squadra
+            standings_type: "total", "first_half", "second_half" (tempo usato per esito e gol)
+            venue_filter: "TOTALE", "CASA", "FUORI"
+
+        Ritorna una riga per (squadra, partita), dalla più recente, con colonne
+        team, is_home, date, home_team, away_team, ft_home_goals, ft_away_goals,
+        outcome (V/N/P, '?' se non determinabile) e goals (gol della partita nel tempo scelto).
+        """
+        columns = ['team', 'is_home', 'date', 'home_team', 'away_team',
+                   'ft_home_goals', 'ft_away_goals', 'outcome', 'goals']
+        if matches_df is None or matches_df.empty:
+            return pd.DataFrame(columns=columns)
+
+        df = matches_df.reindex(columns=[
+            'date', 'home_team', 'away_team', 'ft_home_goals', 'ft_away_goals',
+            'ht_home_goals', 'ht_away_goals', 'ft_result', 'ht_result'
+        ])
+        for col in ['ft_home_goals', 'ft_away_goals', 'ht_home_goals', 'ht_away_goals']:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(float)
+        # Ordine cronologico dal numero del giorno salvato all'import
+        df['match_day'] = _match_day_values(matches_df)
+        df['position'] = np.arange(len(df))
+        df = df.dropna(subset=['match_day'])
+
+        sides = []
+        if venue_filter != "FUORI":
+            sides.append(df.assign(team=df['home_team'], is_home=True))
+        if venue_filter != "CASA":
+            sides.append(df.assign(team=df['away_team'], is_home=False))
+        rows = pd.concat(sides, ignore_index=True)
+
+        rows = rows.sort_values(['team', 'match_day', 'position'], ascending=[True, False, True], kind='stable')
+        rows = rows[rows.groupby('team', sort=False).cumcount() < n].reset_index(drop=True)
+
+        is_home = rows['is_home'].to_numpy(dtype=bool)
+        if standings_type == "second_half":
+            home_goals = rows['ft_home_goals'] - rows['ht_home_goals']
+            away_goals = rows['ft_away_goals'] - rows['ht_away_goals']
+            diff = np.where(is_home, home_goals - away_goals, away_goals - home_goals)
+            rows['outcome'] = np.select([diff > 0, diff == 0, diff < 0], ['V', 'N', 'P'], default='?')
+        else:
+            result_col = 'ht_result' if standings_type == "first_half" else 'ft_result'
+            result = rows[result_col].astype(str).str.upper().to_numpy()
+            rows['outcome'] = np.select(
+                [result == 'D', result == 'H', result == 'A'],
+                ['N', np.where(is_home, 'V', 'P'), np.where(is_home, 'P', 'V')],
+                default='?'
+            )
+            if standings_type == "first_half":
+                home_goals, away_goals = rows['ht_home_goals'], rows['ht_away_goals']
+            else:
+                home_goals, away_goals = rows['ft_home_goals'], rows['ft_away_goals']
+        rows['goals'] = home_goals + away_goals
+
+        return rows[columns]
+
     def get_head_to_head(self, matches_df, team1, team2, limit=5):
         """Ottiene gli ultimi N scontri diretti tra due squadre"""
         h2h_matches = matches_df[
@@ -467,7 +736,7 @@ class FootballStatsCalculator:
             ((matches_df['home_team'] == team2) & (matches_df['away_team'] == team1))
         ].copy()
         
-        h2h_matches = h2h_matches.sort_values('date', ascending=False)
+        h2h_matches = h2h_matches.iloc[np.argsort(-_match_day_values(h2h_matches), kind='stable')]
         return h2h_matches.head(limit)
     
     def detect_team_achievements(self, standings_df, season, matches_remaining=8):